@@ -14,6 +14,9 @@ Version:1.1
 import sys
 import math
 import logging
+import numpy as np
+
+import radiation_table
 
 logger = logging.getLogger(__name__)
 
@@ -79,19 +82,9 @@ def calculate_solar_radiation(lat, doy, sunlight_hour, e_a, tmin, tmax, altitude
     Returns:
         float: solar radiation (MJ/m^2/day)
     """
-    # convert latitude to radians
-    latitude = lat*math.pi/180
-
-    # calculate solar radiation parameters
-    d_r = 1 + 0.033 * math.cos(2 * math.pi * doy / 365)
-    solar_declination = 0.409 * math.sin(2 * math.pi * doy / 365 - 1.39)
-    sunset_hour_angle = math.acos(-math.tan(latitude) * math.tan(solar_declination))
-
-    r_a = (24 * 60 / math.pi * 0.082 * d_r *
-          (sunset_hour_angle * math.sin(latitude) * math.sin(solar_declination) +
-           math.cos(latitude) * math.cos(solar_declination) * math.sin(sunset_hour_angle)))
+    # extraterrestrial radiation and daylight hours from the lookup table
+    r_a, sunshine_duration = radiation_table.shared_table.lookup(lat, doy)
 
-    sunshine_duration = (24*sunset_hour_angle) / math.pi
     r_s = (A_S + ((B_S*sunlight_hour)/sunshine_duration))*r_a
     r_s0 = (0.75 + (2e-5)*altitude)*r_a
 
@@ -125,6 +118,158 @@ def penman_monteith(temp, delta, wind_speed, solar_radiation, gamma, e_a, e_s):
             (delta + gamma*(1 + (0.34 * wind_speed)))
 
 
+def calculate_vpd_array(tmin, tmax, rhmin, rhmax):
+    """
+    Array version of calculate_vpd, calculating the mean saturation and actual
+    vapour pressure for many days at once
+
+    Args:
+        tmin (np.array): daily minimum temperature (°C).
+        tmax (np.array): daily maximum temperature (°C).
+        rhmin (np.array): daily minimum relative humidity (%)
+        rhmax (np.array): daily maximum relative humdity (%)
+
+    Returns:
+        e_s (np.array): mean saturation vapour pressure
+        e_a (np.array): actual vapour pressure
+    """
+    e0t_min = 0.618 * np.exp((17.27 * tmin) / (tmin + 237.3))
+    e0t_max = 0.618 * np.exp((17.27 * tmax) / (tmax + 237.3))
+
+    e_s = (e0t_min + e0t_max) / 2
+    e_a = ((e0t_min * rhmax) + (e0t_max * rhmin)) / 200
+
+    return e_s, e_a
+
+
+def calculate_delta_array(tmean):
+    """
+    Array version of calculate_delta
+
+    Args:
+        tmean (np.array): daily mean temperature (°C)
+
+    Returns:
+        np.array: slope of saturation vapour pressure curve (delta) (kPa/°C)
+    """
+    return (4098 * 0.6108 * np.exp(17.27 * tmean / (tmean + 237.3)) /
+            ((tmean + 237.3) ** 2))
+
+
+def calculate_solar_radiation_array(lat, doy, sunlight_hour, e_a, tmin, tmax, altitude):
+    """
+    Array version of calculate_solar_radiation
+
+    Args:
+        lat (np.array): latitude coordinates of location
+        doy (np.array): day in the year
+        sunlight_hour (np.array): number of direct sunlight hours per day
+        e_a (np.array): actual vapour pressure (kPa)
+        tmin (np.array): daily minimum temperature (°C).
+        tmax (np.array): daily maximum temperature (°C).
+        altitude (np.array): altitude of location (m)
+
+    Returns:
+        np.array: solar radiation (MJ/m^2/day)
+    """
+    # extraterrestrial radiation and daylight hours from the lookup table
+    r_a, sunshine_duration = radiation_table.shared_table.lookup_array(lat, doy)
+
+    r_s = (A_S + ((B_S*sunlight_hour)/sunshine_duration))*r_a
+    r_s0 = (0.75 + (2e-5)*altitude)*r_a
+
+    r_ns = (1-ALBEDO)*r_s
+
+    r_nl = (4.903e-09 * (((tmin + 273.16) ** 4 + (tmax + 273) ** 4) / 2) *
+           (0.34 - (0.14 * np.sqrt(e_a))) * (1.35 * r_s / r_s0 - 0.35))
+
+    return r_ns-r_nl
+
+
+def penman_monteith_array(temp, delta, wind_speed, solar_radiation, gamma, e_a, e_s):
+    """
+    Array version of penman_monteith, the formula only uses arithmetic and
+    therefore works on numpy arrays as well
+
+    Args:
+        temp (np.array): daily mean temperature (°C)
+        delta (np.array): slope of saturation vapour pressure curve (kPa/°C)
+        wind_speed (np.array): Wind speed at 2 meters above ground (m/s-1).
+        solar_radiation (np.array): Solar radiation (MJ/m^2/day).
+        gamma (np.array): Psychrometric constant (kPa/°C).
+        e_a (np.array): actual vapour pressure (kPa)
+        e_s (np.array): mean saturation vapour pressure (kPa)
+
+    Returns:
+        np.array: reference evapotranspiration (ET0) in mm/day.
+    """
+    return penman_monteith(temp, delta, wind_speed, solar_radiation, gamma, e_a, e_s)
+
+
+def round_array(values, decimals=1):
+    """
+    Round array the same way as the builtin round(). np.round scales the
+    values before rounding, which can differ from round() for values close to
+    a tie, those values are rounded with round() instead.
+
+    Args:
+        values (np.array): values to round
+        decimals (int): number of decimals
+
+    Returns:
+        rounded (np.array): rounded values
+    """
+    values = np.asarray(values, dtype=float)
+    rounded = np.round(values, decimals)
+
+    scaled = values * 10 ** decimals
+    near_tie = np.abs(np.abs(scaled - np.floor(scaled)) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_tie):
+        rounded[i] = round(float(values[i]), decimals)
+
+    return rounded
+
+
+def calculate_et0(df):
+    """
+    Calculate reference evapotranspiration for all rows of the dataframe in
+    one pass, using the array versions of the functions
+
+    Args:
+        df(pandas.Dataframe): dataframe with meteorological information
+
+    Returns:
+        np.array: reference evapotranspiration (ET0) in mm/day, rounded to 0.1
+    """
+    lat = df['lat'].to_numpy(dtype=float)
+    tmin = df['Tmin'].to_numpy(dtype=float)
+    tmax = df['Tmax'].to_numpy(dtype=float)
+    tmean = df['Tmean'].to_numpy(dtype=float)
+    rhmin = df['RHmin'].to_numpy(dtype=float)
+    rhmax = df['RHmax'].to_numpy(dtype=float)
+    uz = df['uz'].to_numpy(dtype=float)
+    sunlight_hour = df['n'].to_numpy(dtype=float)
+    pressure = df['pressure'].to_numpy(dtype=float)
+    doy = df['doy'].to_numpy(dtype=float)
+    altitude = df['z'].to_numpy(dtype=float)
+
+    # Calculate delta
+    delta = calculate_delta_array(tmean)
+
+    # Calculate gamma
+    gamma = 0.000665*pressure
+
+    # Calculate vapour pressure deficit
+    e_s, e_a = calculate_vpd_array(tmin, tmax, rhmin, rhmax)
+
+    # Calculate solar radiation
+    solar_radiation = calculate_solar_radiation_array(lat, doy, sunlight_hour, e_a,
+                                                      tmin, tmax, altitude)
+
+    # Use all parameters in penman monteith method to calculate ET0
+    et0 = penman_monteith_array(tmean, delta, uz, solar_radiation, gamma, e_a, e_s)
+
+    return round_array(et0, 1)
 
 
 def main(df, logger):
@@ -141,37 +286,9 @@ def main(df, logger):
 
     logger.info("ET0 calculation started. \n")
 
-    for index, row in df.iterrows():
-        lat = row['lat']
-        tmin = row['Tmin']
-        tmax = row['Tmax']
-        tmean = row['Tmean']
-        rhmin = row['RHmin']
-        rhmax = row['RHmax']
-        uz = row['uz']
-        sunlight_hour = row['n']
-        pressure = row['pressure']
-        doy = row['doy']
-        altitude = row['z']
-
-        # Calculate delta
-        delta = calculate_delta(tmean)
-
-        # Calculate gamma
-        gamma = 0.000665*pressure
-
-        # Calculate vapour pressure deficit
-        e_s, e_a = calculate_vpd(tmin, tmax, rhmin, rhmax)
-
-        # Calculate solar radiation
-        solar_radiation = calculate_solar_radiation(lat, doy, sunlight_hour, e_a, tmin, tmax, altitude)
-
-        # Use all parameters in penman monteith method to calculate ET0
-        ET0 = penman_monteith(tmean, delta, uz, solar_radiation, gamma, e_a, e_s)
-
-        # Add ET0 to dataframe
-        df.at[index, 'ET0'] = round(ET0,1)
-  
+    # Calculate ET0 for all dates at once and add to dataframe
+    df['ET0'] = calculate_et0(df)
+
     logger.info("ET0 calculation completed. \n")
 
     return df
@@ -14,20 +14,28 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-def main(df, logger):
+def main(df, logger, curve=None):
     """
     Main function of this script, calculating the actual evapotranspiration (ETc)
 
     Args:
         df (pandas.Dataframe): dataframe with information to calculate ETc
+        curve (Kc_curve.KcCurve): Kc curve to evaluate at the day in the year,
+        None to use the 'Kc' column of the dataframe
 
     Returns:
         df (pandas.Dataframe): dataframe with addition of ETc
     """
     logger.info("ETc calculation started. \n")
 
+    # Kc value of each date
+    if curve is None:
+        kc = df['Kc']
+    else:
+        kc = curve(df['doy'])
+
     # Calculate ETc and add to dataframe
-    df['ETc'] = df['ET0'] * df['Kc']
+    df['ETc'] = df['ET0'] * kc
 
     logger.info("ETc calculation completed. \n")
     
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+check_stub
+Description: check the concurrent fetch of get_weather_data.py against the
+local stub server: responses returned in request order while the server
+answers later hours first, no more simultaneous requests than the
+concurrency, every hour requested exactly once and connections reused
+between requests
+Author: Susan Reefman
+Date: 17/10/2026
+Version: 1.0
+"""
+
+import os
+import sys
+import time
+import argparse
+from collections import Counter
+from urllib.parse import urlparse, parse_qs
+
+import get_weather_data
+from stub_server import StubServer
+
+
+def parse_args():
+    """
+    parse command-line arguments for the size of the check
+
+    Returns:
+        parser.parse_args()
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--concurrency", type=int, default=get_weather_data.CONCURRENCY,
+                        help="""Maximum number of simultaneous requests""")
+    parser.add_argument("-l", "--locations", type=int, default=3,
+                        help="""Number of locations, each fetched for one day""")
+    parser.add_argument("-d", "--delay", type=float, default=0.01,
+                        help="""Average delay of the responses of the stub server in
+                        seconds, later hours of a day are answered sooner""")
+    return parser.parse_args()
+
+
+def requested_hours(paths):
+    """
+    Count the hours requested from the weather endpoint
+
+    Args:
+        paths (list): list with the path of every request
+
+    Returns:
+        (Counter): number of requests per (latitude, longitude, date)
+    """
+    hours = Counter()
+    for path in paths:
+        url = urlparse(path)
+        if url.path.endswith('/timemachine'):
+            query = parse_qs(url.query)
+            hours[(float(query['lat'][0]), float(query['lon'][0]),
+                   int(query['dt'][0]))] += 1
+
+    return hours
+
+
+def main():
+    """
+    Main function of this script, fetching hours from the stub server and
+    printing the result of each check
+
+    Returns:
+        (int): 0 when all checks pass, otherwise 1
+    """
+    args = parse_args()
+
+    date = 1693526400
+    requests_list = [(44.0 + location, 7.0, date + 3600 * hour)
+                     for location in range(args.locations)
+                     for hour in range(get_weather_data.HOURS)]
+
+    with StubServer(delay=args.delay, reverse=True) as server:
+        os.environ['weather_api_url'] = server.weather_url
+        session = get_weather_data.create_session(args.concurrency)
+
+        start = time.perf_counter()
+        responses = get_weather_data.get_hours(session, requests_list, 'key',
+                                               args.concurrency)
+        seconds = time.perf_counter() - start
+        session.close()
+
+        hours = requested_hours(server.requests)
+        ok = all(status == 200 for status, _ in responses)
+        checks = [
+            ("all responses OK", ok),
+            ("responses in request order",
+             ok and [data['data'][0]['dt'] for _, data in responses] ==
+             [dt for _, _, dt in requests_list]),
+            (f"simultaneous requests {server.max_active} <= {args.concurrency}",
+             server.max_active <= args.concurrency),
+            ("every hour requested exactly once",
+             set(hours) == {(lat, lon, dt) for lat, lon, dt in requests_list}
+             and set(hours.values()) == {1}),
+            (f"connections {server.connections} <= {args.concurrency}",
+             server.connections <= args.concurrency),
+        ]
+
+    # The order check only means something when the server answered out of order
+    out_of_order = list(requested_hours(server.answered)) != list(hours)
+    print(f"Fetched {len(requests_list)} hours in {seconds:.2f} s, answered "
+          f"{'out of' if out_of_order else 'in'} request order")
+    for name, passed in checks:
+        print(f"{'OK  ' if passed else 'FAIL'} {name}")
+
+    return 0 if all(passed for _, passed in checks) else 1
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print("\nScript terminated by the user.")
+        sys.exit(1)
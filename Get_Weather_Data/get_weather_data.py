@@ -13,11 +13,33 @@ Version: 2
 import os
 import sys
 import csv
+import time
 import argparse
 import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
+import response_cache
+
+# Shared modules of the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import table_io
+
+# Constants
+WEATHER_URL = 'https://api.openweathermap.org/data/3.0/onecall/timemachine'
+ELEVATION_URL = 'https://maps.googleapis.com/maps/api/elevation/json'
+HOURS = 24
+DAY = 86400
+CONCURRENCY = 8
+RATE = 50
+ELEVATION_BATCH = 256
+GRID_RESOLUTION = 0.001
+WEATHER_GRID = 0.01
+
 
 def is_valid_date(date):
     """
@@ -87,44 +109,167 @@ def parse_args():
 
     Returns:
         args.date (int): date in Unix timestamp format
+        args.end (int): last date in Unix timestamp format
         args.latitude (int): latitude of location in decimal degrees
         args.longitude (int): longitude of location in decimal degrees
+        args.manifest (str): path of CSV file with locations
         args.result (str): path and file name of result file in CSV format
+        args.per_location (bool): write a result file per location
+        args.format (str): format of the result files per location
+        args.concurrency (int): maximum number of simultaneous requests
+        args.rate (float): maximum number of requests per second
+        args.cache (str): path of the response cache database or None
+        args.cache_size (int): maximum number of responses in the cache
+        args.grid (float): resolution of the altitude grid in decimal degrees
+        args.weather_grid (float): resolution of the weather grid in decimal degrees
     """
     parser = argparse.ArgumentParser()
     parser.add_argument("-d", "--date", type=int,
-                        help="""Date in Unix timestamp format""",
+                        help="""Date in Unix timestamp format, first date of the
+                        range in batch mode""",
                         required=True)
+    parser.add_argument("-e", "--end", type=int,
+                        help="""Last date in Unix timestamp format, to get a range
+                        of days""")
     parser.add_argument("-l", "--latitude",
-                        help="""Latitude in decimal degrees""",
-                        required=True)
+                        help="""Latitude in decimal degrees""")
     parser.add_argument("-o", "--longitude",
-                        help="""Longitude in decimal degrees""",
-                        required=True)
+                        help="""Longitude in decimal degrees""")
+    parser.add_argument("-m", "--manifest",
+                        help="""CSV file with 'lat' and 'lon' columns, and optionally
+                        a 'field' column, of the locations to get in batch mode""")
     parser.add_argument("-r", "--result",
-                        help="""path and name to result file in CSV format""",
+                        help="""path and name to result file in CSV, Parquet (.parquet)
+                        or Feather (.feather) format, or the result directory with
+                        --per-location""",
                         required=True)
+    parser.add_argument("--per-location", action="store_true",
+                        help="""Write a result file per location""")
+    parser.add_argument("--format", choices=['csv', 'parquet', 'feather'], default='csv',
+                        help="""Format of the result files per location""")
+    parser.add_argument("-c", "--concurrency", type=int, default=CONCURRENCY,
+                        help="""Maximum number of simultaneous requests""")
+    parser.add_argument("--rate", type=float, default=RATE,
+                        help="""Maximum number of requests per second""")
+    parser.add_argument("--cache", default=os.getenv('weather_cache'),
+                        help="""SQLite database caching the API responses between runs""")
+    parser.add_argument("--cache-size", type=int, default=response_cache.MAX_ENTRIES,
+                        help="""Maximum number of responses in the cache""")
+    parser.add_argument("--grid", type=float, default=GRID_RESOLUTION,
+                        help="""Resolution in decimal degrees of the altitude grid, locations
+                        in the same grid cell share one altitude in batch mode""")
+    parser.add_argument("--weather-grid", type=float, default=WEATHER_GRID,
+                        help="""Resolution in decimal degrees of the weather grid, locations
+                        in the same grid cell share one weather fetch in batch mode, 0 to
+                        fetch every location""")
     args = parser.parse_args()
 
-    if not is_valid_date(args.date):
+    if not is_valid_date(args.date) or (args.end is not None and not is_valid_date(args.end)):
         print('Invalid date input. Please provide a valid Unix timestamp.')
-        return 0
+        sys.exit(1)
 
-    if not is_valid_latitude(args.latitude):
-        print('Invalid latitude input. Please provide a valid decimal degree value within the range [-90, 90].')
-        return 0
+    if args.manifest is None:
+        if args.latitude is None or args.longitude is None:
+            print('Please provide a latitude and longitude, or a manifest of locations.')
+            sys.exit(1)
+
+        if not is_valid_latitude(args.latitude):
+            print('Invalid latitude input. Please provide a valid decimal degree value within the range [-90, 90].')
+            sys.exit(1)
 
-    if not is_valid_longitude(args.longitude):
-        print('Invalid longitude input. Please provide a valid decimal degree value within the range [-180, 180].')
-        return 0
+        if not is_valid_longitude(args.longitude):
+            print('Invalid longitude input. Please provide a valid decimal degree value within the range [-180, 180].')
+            sys.exit(1)
+
+    if args.grid <= 0 or args.weather_grid < 0:
+        print('Invalid grid input. Please provide a positive resolution in decimal degrees.')
+        sys.exit(1)
 
     print('All inputs are valid.')
 
 
-    return args.date, args.latitude, args.longitude, args.result
+    return args
+
+
+def read_manifest(file):
+    """
+    Read locations from a CSV file with 'lat' and 'lon' columns and an
+    optional 'field' column
+
+    Args:
+        file (str): path of CSV file
+
+    Returns:
+        locations (list): list with (name, latitude, longitude) per location
+    """
+    locations = []
+    with open(file, newline='') as manifest:
+        for row in csv.DictReader(manifest):
+            lat, lon = row['lat'].strip(), row['lon'].strip()
+            if not is_valid_latitude(lat) or not is_valid_longitude(lon):
+                print(f'Invalid location in manifest: {lat}, {lon}')
+                sys.exit(1)
+            name = row.get('field') or f"{lat}_{lon}"
+            locations.append((name, lat, lon))
+
+    return locations
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter shared by threads. Every request takes a token,
+    tokens are added at rate per second up to capacity.
+
+    Args:
+        rate (float): number of tokens added per second
+        capacity (int): maximum number of tokens, the size of a burst
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1, int(rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Wait until a token is available and take it
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity,
+                                  self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+def create_session(pool_size=CONCURRENCY):
+    """
+    Create session keeping connections alive between requests
+
+    Args:
+        pool_size (int): maximum number of connections per host
+
+    Returns:
+        session (requests.Session): session with a connection pool
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
 
 
-def get_altitude(lat, lon, api_key):
+def get_altitude(lat, lon, api_key, session=None, limiter=None, cache=None):
     """
     Get the altitude for location through Google Maps Elevation API
 
@@ -132,19 +277,411 @@ def get_altitude(lat, lon, api_key):
         lat (int): latitude in decimal degrees
         lon (int): longitude in decimal degrees
         api_key (str): key to API
+        session (requests.Session): session to use, None for a new connection
+        limiter (TokenBucket): rate limiter or None
+        cache (response_cache.ResponseCache): response cache or None
     Returns:
         altitude (int): altitude of given location
     """
-    base_url = f"https://maps.googleapis.com/maps/api/elevation/json?locations={lat},{lon}&key={api_key}"
-    response = requests.get(base_url).json()
-    check_error_response(response)
+    if cache is not None:
+        data = cache.get('elevation', lat, lon)
+        if data is not None:
+            return data['results'][0]['elevation']
+
+    if limiter is not None:
+        limiter.acquire()
 
-    altitude = response['results'][0]['elevation']
-    response.close()
+    base_url = os.getenv('elevation_api_url', ELEVATION_URL)
+    params = {'locations': f"{lat},{lon}", 'key': api_key}
+
+    with (session or requests).get(base_url, params=params) as response:
+        data = response.json()
+    check_error_response(data)
+
+    if cache is not None:
+        cache.put('elevation', lat, lon, 0, data)
+
+    altitude = data['results'][0]['elevation']
 
     return altitude
 
 
+class Grid:
+    """
+    Grid of square cells, locations are snapped to the center of their cell
+
+    Args:
+        resolution (float): size of a grid cell in decimal degrees
+    """
+
+    def __init__(self, resolution):
+        self.resolution = resolution
+
+    def cell(self, lat, lon):
+        """
+        Get the grid cell of a location
+
+        Args:
+            lat (float): latitude in decimal degrees
+            lon (float): longitude in decimal degrees
+
+        Returns:
+            (tuple): row and column of the grid cell
+        """
+        return round(float(lat) / self.resolution), round(float(lon) / self.resolution)
+
+    def center(self, cell):
+        """
+        Get the location of the center of a grid cell
+
+        Args:
+            cell (tuple): row and column of the grid cell
+
+        Returns:
+            (tuple): latitude and longitude in decimal degrees
+        """
+        return round(cell[0] * self.resolution, 10), round(cell[1] * self.resolution, 10)
+
+
+class AltitudeIndex(Grid):
+    """
+    Altitudes of a grid of cells, so nearby locations share one altitude
+
+    Args:
+        resolution (float): size of a grid cell in decimal degrees
+    """
+
+    def __init__(self, resolution=GRID_RESOLUTION):
+        super().__init__(resolution)
+        self.altitudes = {}
+
+    def get(self, lat, lon):
+        """
+        Get the altitude of a location
+
+        Args:
+            lat (float): latitude in decimal degrees
+            lon (float): longitude in decimal degrees
+
+        Returns:
+            altitude (float): altitude of the grid cell, None when unknown
+        """
+        return self.altitudes.get(self.cell(lat, lon))
+
+    def __contains__(self, cell):
+        return cell in self.altitudes
+
+    def __setitem__(self, cell, altitude):
+        self.altitudes[cell] = altitude
+
+
+def get_altitudes(locations, api_key, session=None, limiter=None, cache=None, index=None,
+                  batch_size=ELEVATION_BATCH):
+    """
+    Get the altitude of many locations through Google Maps Elevation API.
+    Locations are snapped to the grid of the index, and only grid cells that
+    are not in the index or cache are requested, batch_size cells per request.
+
+    Args:
+        locations (list): list with (latitude, longitude) per location
+        api_key (str): key to API
+        session (requests.Session): session to use, None for a new connection
+        limiter (TokenBucket): rate limiter or None
+        cache (response_cache.ResponseCache): response cache or None
+        index (AltitudeIndex): altitude index to use and fill, None for a new index
+        batch_size (int): maximum number of locations per request
+
+    Returns:
+        altitudes (list): altitude of every location, in order
+    """
+    if index is None:
+        index = AltitudeIndex()
+
+    # Unknown grid cells, in order of the locations
+    cells = [cell for cell in dict.fromkeys(index.cell(lat, lon) for lat, lon in locations)
+             if cell not in index]
+
+    missing = []
+    for cell in cells:
+        data = cache.get('elevation', *index.center(cell)) if cache is not None else None
+        if data is None:
+            missing.append(cell)
+        else:
+            index[cell] = data['results'][0]['elevation']
+
+    base_url = os.getenv('elevation_api_url', ELEVATION_URL)
+    for start in range(0, len(missing), batch_size):
+        batch_cells = missing[start:start + batch_size]
+        centers = [index.center(cell) for cell in batch_cells]
+
+        if limiter is not None:
+            limiter.acquire()
+
+        params = {'locations': '|'.join(f"{lat},{lon}" for lat, lon in centers),
+                  'key': api_key}
+        with (session or requests).get(base_url, params=params) as response:
+            data = response.json()
+        check_error_response(data)
+
+        for cell, (lat, lon), result in zip(batch_cells, centers, data['results']):
+            index[cell] = result['elevation']
+            # Cached in the format of a response for one location
+            if cache is not None:
+                cache.put('elevation', lat, lon, 0,
+                          {'results': [result], 'status': data.get('status')})
+
+    altitudes = [index.get(lat, lon) for lat, lon in locations]
+
+    return altitudes
+
+
+def get_hour(session, lat, lon, date, api_key, limiter=None, cache=None):
+    """
+    Get meteorological data of one hour through the OpenWeather API
+
+    Args:
+        session (requests.Session): session to use
+        lat (int): latitude in decimal degrees
+        lon (int): longitude in decimal degrees
+        date (int): date in Unix timestamp
+        api_key (str): key to API
+        limiter (TokenBucket): rate limiter or None
+        cache (response_cache.ResponseCache): response cache or None
+
+    Returns:
+        status_code (int): HTTP status code of the response
+        data (dict): response of the API, None when the request failed
+    """
+    if cache is not None:
+        data = cache.get('timemachine', lat, lon, date)
+        if data is not None:
+            return 200, data
+
+    if limiter is not None:
+        limiter.acquire()
+
+    base_url = os.getenv('weather_api_url', WEATHER_URL)
+    params = {'lat': lat, 'lon': lon, 'dt': date, 'units': 'metric', 'appid': api_key}
+
+    with session.get(base_url, params=params) as response:
+        if not response.status_code == 200:
+            return response.status_code, None
+        data = response.json()
+
+    # Only successful responses are cached
+    if cache is not None:
+        cache.put('timemachine', lat, lon, date, data)
+
+    return 200, data
+
+
+def flatten(data, altitude):
+    """
+    Flatten the response of the OpenWeather API to one row
+
+    Args:
+        data (dict): response of the API
+        altitude (int): altitude of the location
+
+    Returns:
+        flat_data (dict): dictionary with the meteorological data
+    """
+    flat_data = {
+        'lat': data['lat'],
+        'lon': data['lon'],
+        'timezone': data['timezone'],
+        'timezone_offset': data['timezone_offset'],
+        'dt': data['data'][0]['dt'],
+        'sunrise': data['data'][0]['sunrise'],
+        'sunset': data['data'][0]['sunset'],
+        'temp': data['data'][0]['temp'],
+        'feels_like': data['data'][0]['feels_like'],
+        'pressure': data['data'][0]['pressure'],
+        'humidity': data['data'][0]['humidity'],
+        'dew_point': data['data'][0]['dew_point'],
+        'clouds': data['data'][0]['clouds'],
+        'wind_speed': data['data'][0]['wind_speed'],
+        'wind_deg': data['data'][0]['wind_deg'],
+        'weather_id': data['data'][0]['weather'][0]['id'],
+        'weather_main': data['data'][0]['weather'][0]['main'],
+        'weather_description': data['data'][0]['weather'][0]['description'],
+        'weather_icon': data['data'][0]['weather'][0]['icon'],
+        'altitude':altitude
+    }
+
+    return flat_data
+
+
+def get_hours(session, requests_list, api_key, concurrency=CONCURRENCY, limiter=None,
+              cache=None):
+    """
+    Get hourly meteorological data for a list of locations and hours, with at
+    most concurrency requests at the same time
+
+    Args:
+        session (requests.Session): session to use
+        requests_list (list): list with (latitude, longitude, date) per hour
+        api_key (str): key to API
+        concurrency (int): maximum number of simultaneous requests
+        limiter (TokenBucket): rate limiter or None
+        cache (response_cache.ResponseCache): response cache or None
+
+    Returns:
+        responses (list): list with (status code, data) per hour, in order
+    """
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        responses = list(executor.map(
+            lambda hour: get_hour(session, *hour, api_key, limiter, cache), requests_list))
+
+    return responses
+
+
+def get_day(session, lat, lon, date, api_key, concurrency=CONCURRENCY, limiter=None,
+            cache=None):
+    """
+    Get hourly meteorological data of 24 hours from the given date, with at
+    most concurrency requests at the same time
+
+    Args:
+        session (requests.Session): session to use
+        lat (int): latitude in decimal degrees
+        lon (int): longitude in decimal degrees
+        date (int): date in Unix timestamp
+        api_key (str): key to API
+        concurrency (int): maximum number of simultaneous requests
+        limiter (TokenBucket): rate limiter or None
+        cache (response_cache.ResponseCache): response cache or None
+
+    Returns:
+        responses (list): list with (status code, data) per hour, in order
+    """
+    requests_list = [(lat, lon, date + 3600 * hour) for hour in range(HOURS)]
+
+    return get_hours(session, requests_list, api_key, concurrency, limiter, cache)
+
+
+def to_rows(responses, altitude):
+    """
+    Check the responses and flatten them to rows
+
+    Args:
+        responses (list): list with (status code, data) per hour
+        altitude (int): altitude of the location
+
+    Returns:
+        flat_data_list (list): list with a dictionary per hour
+    """
+    flat_data_list = []
+    for status_code, data in responses:
+
+        # Check for error in response
+        if not status_code == 200:
+            print(f'Error has occurred with the OpenWeather API: {status_code}')
+            sys.exit(1)
+
+        # Flatten the data
+        flat_data_list.append(flatten(data, altitude))
+
+    return flat_data_list
+
+
+def write_rows(file, flat_data_list):
+    """
+    Write rows to a file, in CSV format unless the extension is of a
+    Parquet or Feather file
+
+    Args:
+        file (str): path of file
+        flat_data_list (list): list with a dictionary per hour
+    """
+    if table_io.file_format(file) != 'csv':
+        table_io.write_table(pd.DataFrame(flat_data_list), file)
+        return
+
+    with open(file, 'w', newline='') as output:
+        fieldnames = flat_data_list[0].keys()
+        writer = csv.DictWriter(output, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(flat_data_list)
+
+
+def weather_cells(locations, resolution):
+    """
+    Map locations to shared weather grid cells
+
+    Args:
+        locations (list): list with (name, latitude, longitude) per location
+        resolution (float): size of a grid cell in decimal degrees, 0 for a
+        cell per location
+
+    Returns:
+        cells (list): list with (latitude, longitude) of every cell to fetch
+        assignment (list): index of the cell of every location
+    """
+    if not resolution:
+        cells = list(dict.fromkeys((lat, lon) for _, lat, lon in locations))
+        assignment = [cells.index((lat, lon)) for _, lat, lon in locations]
+        return cells, assignment
+
+    grid = Grid(resolution)
+    keys = [grid.cell(lat, lon) for _, lat, lon in locations]
+    unique = list(dict.fromkeys(keys))
+    positions = {key: i for i, key in enumerate(unique)}
+
+    cells = [grid.center(key) for key in unique]
+    assignment = [positions[key] for key in keys]
+
+    return cells, assignment
+
+
+def batch(locations, dates, api_key_w, api_key_a, concurrency=CONCURRENCY, rate=RATE,
+          cache=None, grid=GRID_RESOLUTION, weather_grid=WEATHER_GRID):
+    """
+    Get hourly meteorological data of all days for all locations, sharing one
+    connection pool and one rate limiter between all requests
+
+    Args:
+        locations (list): list with (name, latitude, longitude) per location
+        dates (list): list with the dates in Unix timestamp
+        api_key_w (str): key to OpenWeather API
+        api_key_a (str): key to Google Maps Elevation API
+        concurrency (int): maximum number of simultaneous requests
+        rate (float): maximum number of requests per second
+        cache (response_cache.ResponseCache): response cache or None
+        grid (float): resolution of the altitude grid in decimal degrees
+        weather_grid (float): resolution of the weather grid in decimal degrees,
+        0 to fetch every location
+
+    Returns:
+        rows (dict): dictionary with the list of rows per location name
+    """
+    limiter = TokenBucket(rate)
+    hours = [date + 3600 * hour for date in dates for hour in range(HOURS)]
+
+    with create_session(concurrency) as session:
+        # Get altitude of every location in batched requests
+        altitudes = get_altitudes([(lat, lon) for _, lat, lon in locations], api_key_a,
+                                  session, limiter, cache, AltitudeIndex(grid))
+
+        # Get all hours of every weather cell once
+        cells, assignment = weather_cells(locations, weather_grid)
+        print(f'Fetching {len(cells)} weather cells for {len(locations)} locations')
+        requests_list = [(lat, lon, hour) for lat, lon in cells for hour in hours]
+        responses = get_hours(session, requests_list, api_key_w, concurrency, limiter,
+                              cache)
+
+    # Expand the weather of each cell to its locations
+    rows = {}
+    for i, (name, lat, lon) in enumerate(locations):
+        cell = assignment[i]
+        cell_responses = responses[cell * len(hours):(cell + 1) * len(hours)]
+        rows[name] = to_rows(cell_responses, altitudes[i])
+        for row in rows[name]:
+            row['lat'], row['lon'] = float(lat), float(lon)
+
+    return rows
+
+
 def check_error_response(response):
     """
     Check for error in API response, if error exit script
@@ -172,61 +709,54 @@ def main():
     api_key_a = os.getenv('api_key_a')
 
     # Get date, latitude, longitude and result file from commandline arguments
-    date, latitude, longitude, result = parse_args()
-
-    # Get altitude
-    altitude = get_altitude(latitude, longitude, api_key_a)
-
-    flat_data_list = []
+    args = parse_args()
 
-    # 24 calls, getting hourly meteorological data for the given date and location
-    for _ in range(24):
+    # Open the response cache
+    cache = None
+    if args.cache is not None:
+        cache = response_cache.ResponseCache(args.cache, args.cache_size)
 
-        api_url = f'https://api.openweathermap.org/data/3.0/onecall/timemachine?lat={latitude}&lon={longitude}&dt={date}&units=metric&appid={api_key_w}'
-        date += 3600
-
-        response = requests.get(api_url)
-
-        # Check for error in response
-        if not response.status_code == 200:
-            print(f'Error has occurred with the OpenWeather API: {response.status_code}')
-            sys.exit(1)
-
-        data = response.json()
-        # Flatten the data
-        flat_data = {
-            'lat': data['lat'],
-            'lon': data['lon'],
-            'timezone': data['timezone'],
-            'timezone_offset': data['timezone_offset'],
-            'dt': data['data'][0]['dt'],
-            'sunrise': data['data'][0]['sunrise'],
-            'sunset': data['data'][0]['sunset'],
-            'temp': data['data'][0]['temp'],
-            'feels_like': data['data'][0]['feels_like'],
-            'pressure': data['data'][0]['pressure'],
-            'humidity': data['data'][0]['humidity'],
-            'dew_point': data['data'][0]['dew_point'],
-            'clouds': data['data'][0]['clouds'],
-            'wind_speed': data['data'][0]['wind_speed'],
-            'wind_deg': data['data'][0]['wind_deg'],
-            'weather_id': data['data'][0]['weather'][0]['id'],
-            'weather_main': data['data'][0]['weather'][0]['main'],
-            'weather_description': data['data'][0]['weather'][0]['description'],
-            'weather_icon': data['data'][0]['weather'][0]['icon'],
-            'altitude':altitude
-        }
-
-        flat_data_list.append(flat_data)
-
-    response.close()
-
-    # Write the data in the list to the CSV file
-    with open(result, 'w', newline='') as file:
-        fieldnames = flat_data.keys()
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(flat_data_list)
+    try:
+        if args.manifest is not None:
+            # Get all days of all locations in the manifest
+            locations = read_manifest(args.manifest)
+            end = args.end if args.end is not None else args.date
+            dates = list(range(args.date, end + 1, DAY))
+            rows = batch(locations, dates, api_key_w, api_key_a, args.concurrency,
+                         args.rate, cache, args.grid, args.weather_grid)
+
+            if args.per_location:
+                os.makedirs(args.result, exist_ok=True)
+                for name, flat_data_list in rows.items():
+                    write_rows(os.path.join(args.result, f"{name}.{args.format}"), flat_data_list)
+            else:
+                write_rows(args.result, [row for flat_data_list in rows.values()
+                                         for row in flat_data_list])
+            return 0
+
+        with create_session(args.concurrency) as session:
+            # Get altitude
+            altitude = get_altitude(args.latitude, args.longitude, api_key_a, session,
+                                    cache=cache)
+
+            # 24 calls per day, getting hourly meteorological data for the given date and location
+            end = args.end if args.end is not None else args.date
+            responses = []
+            for date in range(args.date, end + 1, DAY):
+                responses += get_day(session, args.latitude, args.longitude, date,
+                                     api_key_w, args.concurrency, cache=cache)
+
+        flat_data_list = to_rows(responses, altitude)
+
+        # Write the data in the list to the CSV file
+        write_rows(args.result, flat_data_list)
+    finally:
+        if cache is not None:
+            print(f'Response cache: {cache.hits} hits, {cache.misses} misses, '
+                  f'hit rate {cache.hit_rate():.1%}, {len(cache)} responses stored')
+            cache.close()
+
+    return 0
 
 
 if __name__ == "__main__":
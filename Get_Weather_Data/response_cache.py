@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+response_cache
+Description: Persistent cache of OpenWeather and Google Maps Elevation API
+responses in a SQLite database. Historical responses do not change, so a
+response is stored by endpoint, rounded coordinates and timestamp and reused
+in later runs. The least recently used responses are removed when the cache
+holds more than the maximum number of responses, a tenth of the maximum at
+once. The responses are counted once when the cache is opened.
+Author: Susan Reefman
+Date: 16/10/2026
+Version: 1.0
+"""
+
+import json
+import time
+import sqlite3
+import threading
+
+# Constants
+DECIMALS = 4
+MAX_ENTRIES = 1000000
+EVICT = 0.1
+
+
+class ResponseCache:
+    """
+    Cache of API responses in a SQLite database, safe to use from threads
+
+    Args:
+        path (str): path of the database file, created when missing
+        max_entries (int): maximum number of responses kept in the cache
+        decimals (int): number of decimals the coordinates are rounded to
+    """
+
+    def __init__(self, path, max_entries=MAX_ENTRIES, decimals=DECIMALS):
+        self.path = path
+        self.max_entries = max_entries
+        self.decimals = decimals
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'endpoint TEXT, lat REAL, lon REAL, dt INTEGER, data TEXT, used REAL, '
+            'PRIMARY KEY (endpoint, lat, lon, dt))')
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS responses_used ON responses (used)')
+        self.entries = self.connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        self.evict()
+        self.connection.commit()
+
+    def key(self, endpoint, lat, lon, dt=0):
+        """
+        Create the key of a response
+
+        Args:
+            endpoint (str): name of the API endpoint
+            lat (float): latitude in decimal degrees
+            lon (float): longitude in decimal degrees
+            dt (int): date in Unix timestamp, 0 for responses without date
+
+        Returns:
+            (tuple): endpoint, rounded latitude, rounded longitude and date
+        """
+        return (endpoint, round(float(lat), self.decimals),
+                round(float(lon), self.decimals), int(dt))
+
+    def get(self, endpoint, lat, lon, dt=0):
+        """
+        Get a response from the cache
+
+        Args:
+            endpoint (str): name of the API endpoint
+            lat (float): latitude in decimal degrees
+            lon (float): longitude in decimal degrees
+            dt (int): date in Unix timestamp, 0 for responses without date
+
+        Returns:
+            data (dict): cached response, None when not in the cache
+        """
+        key = self.key(endpoint, lat, lon, dt)
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT data FROM responses WHERE endpoint=? AND lat=? AND lon=? AND dt=?',
+                key).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.connection.execute(
+                'UPDATE responses SET used=? WHERE endpoint=? AND lat=? AND lon=? AND dt=?',
+                (time.time(),) + key)
+            self.connection.commit()
+
+        return json.loads(row[0])
+
+    def put(self, endpoint, lat, lon, dt, data):
+        """
+        Store a response in the cache and remove the least recently used
+        responses when the cache is full
+
+        Args:
+            endpoint (str): name of the API endpoint
+            lat (float): latitude in decimal degrees
+            lon (float): longitude in decimal degrees
+            dt (int): date in Unix timestamp, 0 for responses without date
+            data (dict): response of the API
+        """
+        key = self.key(endpoint, lat, lon, dt)
+        with self.lock:
+            new = self.connection.execute(
+                'SELECT 1 FROM responses WHERE endpoint=? AND lat=? AND lon=? AND dt=?',
+                key).fetchone() is None
+            self.connection.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                key + (json.dumps(data), time.time()))
+            self.entries += new
+            self.evict()
+            self.connection.commit()
+
+    def evict(self):
+        """
+        Remove the least recently used responses when there are more than the
+        maximum number of responses, down to EVICT below the maximum, called
+        with the lock held
+        """
+        if self.entries <= self.max_entries:
+            return
+
+        keep = self.max_entries - int(self.max_entries * EVICT)
+        self.connection.execute(
+            'DELETE FROM responses WHERE rowid IN '
+            '(SELECT rowid FROM responses ORDER BY used LIMIT ?)',
+            (self.entries - keep,))
+        self.entries = keep
+
+    def __len__(self):
+        with self.lock:
+            return self.entries
+
+    def hit_rate(self):
+        """
+        Fraction of lookups found in the cache
+
+        Returns:
+            (float): hits divided by lookups, 0 without lookups
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
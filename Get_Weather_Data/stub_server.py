@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+stub_server
+Description: Local stub of the OpenWeather timemachine and Google Maps
+Elevation API, to run get_weather_data.py offline. Responses are generated
+from the request, with an optional delay per request, and the server keeps
+track of the requests, the order they are answered in, the client
+connections and the maximum number of simultaneous requests. check_stub.py
+uses them to check the concurrent fetch.
+Set weather_api_url and elevation_api_url in the environment to the urls
+printed at start to use it.
+Author: Susan Reefman
+Date: 16/10/2026
+Version: 1.0
+"""
+
+import sys
+import json
+import time
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def parse_args():
+    """
+    parse command-line arguments for the port and delay of the server
+
+    Returns:
+        parser.parse_args()
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", "--port", type=int, default=8000,
+                        help="""Port of the server""")
+    parser.add_argument("-d", "--delay", type=float, default=0.0,
+                        help="""Delay of every response in seconds""")
+    parser.add_argument("--reverse", action="store_true",
+                        help="""Answer later hours of a day sooner, with the delay on
+                        average, so responses finish out of request order""")
+    return parser.parse_args()
+
+
+def weather_response(lat, lon, date):
+    """
+    Create a response in the format of the OpenWeather timemachine API
+
+    Args:
+        lat (float): latitude in decimal degrees
+        lon (float): longitude in decimal degrees
+        date (int): date in Unix timestamp
+
+    Returns:
+        (dict): response of the API
+    """
+    day = date - date % 86400
+    hour = (date % 86400) // 3600
+
+    return {
+        'lat': lat,
+        'lon': lon,
+        'timezone': 'UTC',
+        'timezone_offset': 0,
+        'data': [{
+            'dt': date,
+            'sunrise': day + 6 * 3600,
+            'sunset': day + 18 * 3600,
+            'temp': 10 + hour / 2,
+            'feels_like': 9 + hour / 2,
+            'pressure': 1013,
+            'humidity': 80 - hour,
+            'dew_point': 5.0,
+            'clouds': 0,
+            'wind_speed': 2.5,
+            'wind_deg': 180,
+            'weather': [{'id': 800, 'main': 'Clear',
+                         'description': 'clear sky', 'icon': '01d'}]
+        }]
+    }
+
+
+def elevation_response(locations):
+    """
+    Create a response in the format of the Google Maps Elevation API
+
+    Args:
+        locations (str): locations as 'lat,lon' separated by '|'
+
+    Returns:
+        (dict): response of the API
+    """
+    results = []
+    for location in locations.split('|'):
+        lat, lon = (float(value) for value in location.split(','))
+        results.append({'elevation': round(100 + abs(lat) + abs(lon), 1),
+                        'location': {'lat': lat, 'lng': lon}})
+
+    return {'results': results, 'status': 'OK'}
+
+
+def response_delay(server, path, query):
+    """
+    Delay of a response, from 2 times the delay for the first hour of a day
+    down to nearly 0 for the last hour when the server answers in reverse
+
+    Args:
+        server (ThreadingHTTPServer): server with the delay settings
+        path (str): path of the request
+        query (dict): query parameters of the request
+
+    Returns:
+        (float): delay in seconds
+    """
+    if not server.reverse or not path.endswith('/timemachine'):
+        return server.delay
+
+    hour = (int(query['dt']) % 86400) // 3600
+
+    return server.delay * 2 * (24 - hour) / 24
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of the stub server, keeping connections alive
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            server.requests.append(self.path)
+            server.connections.add(self.client_address)
+
+        try:
+            url = urlparse(self.path)
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            time.sleep(response_delay(server, url.path, query))
+
+            if url.path.endswith('/timemachine'):
+                body = weather_response(float(query['lat']), float(query['lon']),
+                                        int(query['dt']))
+            elif url.path.endswith('/elevation/json'):
+                body = elevation_response(query['locations'])
+            else:
+                self.send_error(404)
+                return
+
+            content = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+            with server.lock:
+                server.answered.append(self.path)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, format, *args):
+        # Requests are kept in server.requests instead
+        pass
+
+
+class StubServer:
+    """
+    Stub server running in a background thread, usable as context manager
+
+    Args:
+        port (int): port of the server, 0 for a free port
+        delay (float): delay of every response in seconds
+        reverse (bool): answer later hours of a day sooner
+    """
+
+    def __init__(self, port=0, delay=0.0, reverse=False):
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+        self.server.daemon_threads = True
+        self.server.delay = delay
+        self.server.reverse = reverse
+        self.server.lock = threading.Lock()
+        self.server.active = 0
+        self.server.max_active = 0
+        self.server.requests = []
+        self.server.answered = []
+        self.server.connections = set()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def weather_url(self):
+        return f"{self.url}/data/3.0/onecall/timemachine"
+
+    @property
+    def elevation_url(self):
+        return f"{self.url}/maps/api/elevation/json"
+
+    @property
+    def requests(self):
+        return list(self.server.requests)
+
+    @property
+    def answered(self):
+        return list(self.server.answered)
+
+    @property
+    def max_active(self):
+        return self.server.max_active
+
+    @property
+    def connections(self):
+        return len(self.server.connections)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    """
+    Main function of this script, running the stub server until interrupted
+    """
+    args = parse_args()
+
+    server = StubServer(args.port, args.delay, args.reverse).start()
+    print(f"weather_api_url={server.weather_url}")
+    print(f"elevation_api_url={server.elevation_url}")
+
+    server.thread.join()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\nScript terminated by the user.")
+        sys.exit(1)
@@ -9,11 +9,20 @@ Date: 30/10/2023
 Version: 1.1
 """
 
+import os
 import sys
 import argparse
 import logging
 import pandas as pd
 
+# Shared modules of the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import table_io
+
+# Columns of the hourly weather data that are used
+HOURLY_COLUMNS = {'lat', 'lon', 'dt', 'sunrise', 'sunset', 'temp', 'pressure',
+                  'humidity', 'dew_point', 'wind_speed', 'weather_main', 'altitude'}
+
 
 def parse_args():
     """
@@ -24,11 +33,19 @@ def parse_args():
     """
     parser = argparse.ArgumentParser()
     parser.add_argument("-f", "--file",
-                        help="""The location and name to meteorological data in CSV format""",
+                        help="""The location and name to meteorological data in CSV,
+                        Parquet (.parquet) or Feather (.feather) format""",
                         required=True)
     parser.add_argument("-r", "--result",
-                        help="""The location and name result file in CSV format""",
+                        help="""The location and name result file in CSV, Parquet
+                        (.parquet) or Feather (.feather) format""",
                         required=True)
+    parser.add_argument("--stream", action="store_true",
+                        help="""Read the input file in chunks and write each day per
+                        location as soon as it is complete, hourly records of a
+                        location must be in chronological order""")
+    parser.add_argument("--chunksize", type=int, default=100000,
+                        help="""Number of hourly records read per chunk in stream mode""")
     return parser.parse_args()
 
 
@@ -70,7 +87,7 @@ def read_data(file, logger):
     """
 
     try:
-        df = pd.read_csv(file)
+        df = table_io.read_table(file, columns=lambda column: column in HOURLY_COLUMNS)
 
     except FileNotFoundError:
         logger.info(f"File '{file}' not found. \n")
@@ -82,6 +99,17 @@ def read_data(file, logger):
     return df
 
 
+# Validation rules: name, column, lower bound, upper bound and whether the
+# bounds themselves are valid values
+VALIDATION_RULES = [
+    ('temperature', 'temp', -90.00, 50.00, False),
+    ('pressure', 'pressure', 85.00, 110.00, False),
+    ('humidity', 'humidity', 0, 100, True),
+    ('dew point', 'dew_point', -33, 35, True),
+    ('wind speed', 'wind_speed', 0, 115, True),
+]
+
+
 def validate_instance_type(data):
     """
     Validate instance types in dataset
@@ -93,83 +121,79 @@ def validate_instance_type(data):
         data (pandas.Dataframe): dataframe with weather data
         (str): string with information about instances removed
     """
-    flag = True
     colnames = ["lat", "lon", "dt", "sunrise", "sunset", "temp", "pressure",
                 "humidity", "dew_point", "wind_speed"]
-    try:
-        for i in colnames:
-            data[i] = pd.to_numeric(data[i], errors='raise')
 
-    except ValueError:
-        for i in colnames:
-            data[i] = pd.to_numeric(data[i], errors='coerce')
-        data = data.dropna()
-        flag = False
+    # Values that are present but not numeric become NaN
+    invalid = False
+    for i in colnames:
+        numeric = pd.to_numeric(data[i], errors='coerce')
+        invalid = invalid or bool((numeric.isna() & data[i].notna()).any())
+        data[i] = numeric
 
-    if flag == True:
+    if not invalid:
         return data, 'Instance types validated, no instances removed'
 
+    data = data.dropna()
+
     return data, 'Rows of the columns where instances are not numeric are deleted'
 
 
-def data_validation(data):
+def data_validation(data, logger=None):
     """
-    Validate instance types in dataset
+    Validate contents of dataset with the rules in VALIDATION_RULES, all
+    rules are evaluated in one mask. Pressure is converted from hPa to kPa.
 
     Args:
         data (pandas.Dataframe): dataframe with weather data
+        logger (logging.Logger): logger for the number of removed instances
+        per rule, or None
 
     Returns:
-        result (str): string with information about instances removed
         data (pandas.Dataframe): dataframe with weather data
+        result (str): string with information about instances removed
     """
-    result = 'Data validated, no instances removed'
-    # Temperature of all instances must be between -20 and 40 degrees
-    if not (all(data['temp'] > -90.00) and all(data['temp'] < 50.00)):
-        data = data[(data['temp'] > -90.00) & (data['temp'] < 50.00)]
-        result = 'Removed instances where temperature was lower then -90 or above 50 degrees'
+    # Pressure from hPa to kPa
+    data = data.assign(pressure=data['pressure'] * 0.1)
 
-    # Pressure from hPa to kPa, must be between 85 and 110 kPa
-    data['pressure'] = data['pressure'] * 0.1
-    if not (all(data['pressure'] > 85.00) and all(data['pressure'] < 110.00)):
-        data = data[(data['pressure'] > 85.0) & (data['pressure'] < 110.0)]
-        result = 'Removed instances where pressure was lower then 85 or above 110 kPa'
+    valid = pd.Series(True, index=data.index)
+    rejected = {}
+    for name, column, lower, upper, inclusive in VALIDATION_RULES:
+        if inclusive:
+            rule = (data[column] >= lower) & (data[column] <= upper)
+        else:
+            rule = (data[column] > lower) & (data[column] < upper)
+        rejected[name] = int((~rule).sum())
+        valid &= rule
 
-    # Humidity must be between 0 and 100%
-    if not (all(data['humidity'] >= 0) and all(data['humidity'] <= 100)):
-        data = data[(data['humidity'] >= 0) & (data['humidity'] <= 100)]
-        print('Removed instances where humidity was lower then 0% or above 100%')
+    removed = int((~valid).sum())
+    if removed == 0:
+        return data, 'Data validated, no instances removed'
 
-    # Dew point must be between -33 and 35
-    if not (all(data['dew_point'] >= -33) and all(data['dew_point'] <= 35)):
-        data = data[(data['dew_point'] >= -33) & (data['dew_point'] <= 35)]
-        result = 'Removed instances where dew point was lower then -33 or above 35'
+    if logger is not None:
+        for (name, column, lower, upper, _), count in zip(VALIDATION_RULES, rejected.values()):
+            if count:
+                logger.info(f"Rejected {count} instances where {name} was outside "
+                            f"{lower} and {upper}")
 
-    # Windspeed must be between 0 and 110 m/s
-    if not (all(data['wind_speed'] >= 0) and all(data['wind_speed'] <= 115)):
-        data = data[(data['wind_speed'] >= 0) & (data['wind_speed'] <= 115)]
-        result = 'Removed instances where wind speed was lower then 0 or above 115 m/s'
+    data = data[valid]
+    counts = ', '.join(f"{name} {count}" for name, count in rejected.items() if count)
 
-    return data, result
+    return data, f'Removed {removed} instances ({counts})'
 
 
-def main():
+def prepare_data(df, logger):
     """
-    Main function of this script processing weather data to dataframe with only
-    validated instances.
-    """
-
-    # Configure logger
-    logger = configure_logger()
-
-    # Log the start of the main script
-    logger.info("Main script started.\n")
+    Select, validate and convert the columns of hourly weather data
 
-    # Parse and read file to dataframe
-    args = parse_args()
-    logger.info(f"Using input file: {args.file} \n")
-    df = read_data(args.file, logger)
+    Args:
+        df (pandas.Dataframe): dataframe with hourly weather data as retrieved
+        from the OpenWeather API
 
+    Returns:
+        data (pandas.Dataframe): dataframe with validated hourly weather data
+        and 'date', 'date_per_hour', 'sunrise' and 'sunset' as datetime
+    """
     data = pd.DataFrame({
         "lat": df['lat'],
         "lon": df['lon'],
@@ -187,6 +211,10 @@ def main():
     data.columns = ["lat", "lon", "dt", "sunrise", "sunset", "temp",
                     "pressure", "humidity", "dew_point", "wind_speed", "weather"]
 
+    # Keep altitude when available
+    if 'altitude' in df.columns:
+        data['altitude'] = pd.to_numeric(df['altitude'], errors='coerce')
+
     # Validation of type of instances
     data, result_type = validate_instance_type(data)
     logger.info(f"{result_type}")
@@ -196,10 +224,10 @@ def main():
                                            origin='1970-01-01',
                                            unit='s',
                                            utc=True)
-    data['date'] = pd.to_datetime(data['date_per_hour'].dt.strftime('%Y-%m-%d'))
+    data['date'] = data['date_per_hour'].dt.normalize().dt.tz_localize(None)
 
     # Validation of dataset contents
-    data, result = data_validation(data)
+    data, result = data_validation(data, logger)
     logger.info(f"{result} \n")
 
     # Convert sunrise and sunset to human readable datetime
@@ -212,34 +240,245 @@ def main():
                                     unit='s',
                                     utc=True)
 
-    # Count direct sunshine hours per day
-    unique_dates = data['date'].unique()
+    return data
+
+
+def sunshine_hours(data):
+    """
+    Mark direct sunshine hours, the hours between sunrise and sunset with
+    weather 'Clear'
+
+    Args:
+        data (pandas.Dataframe): dataframe with hourly weather data
+
+    Returns:
+        (pandas.Series): series with 1.0 for direct sunshine hours, else 0.0
+    """
+    return ((data['weather'] == "Clear") &
+            (data['date_per_hour'] >= data['sunrise']) &
+            (data['date_per_hour'] <= data['sunset'])).astype(float)
 
-    for date in unique_dates:
-        filtered_data = data[(data['date'] == date) & (data['date_per_hour'] >= data['sunrise']) & (data['date_per_hour'] <= data['sunset'])]
-        clear_count = sum(filtered_data['weather'] == "Clear")
-        data.loc[data['date'] == date, "sunshine_hour"] = clear_count
+
+def daily_aggregates(data):
+    """
+    Aggregate validated hourly weather data per day in one grouped pass.
+    Direct sunshine hours are the hours between sunrise and sunset with
+    weather 'Clear'.
+
+    Args:
+        data (pandas.Dataframe): dataframe with hourly weather data, 'date',
+        'date_per_hour', 'sunrise' and 'sunset' as datetime
+
+    Returns:
+        df (pandas.Dataframe): dataframe with daily weather data
+    """
+    # Mark direct sunshine hours
+    data = data.assign(sunshine_hour=sunshine_hours(data))
 
     # Create new dataframe
+    df = data.groupby('date').agg(
+        lat=('lat', 'min'),
+        lon=('lon', 'min'),
+        Tmin=('temp', 'min'),
+        Tmax=('temp', 'max'),
+        Tmean=('temp', 'mean'),
+        RHmin=('humidity', 'min'),
+        RHmax=('humidity', 'max'),
+        uz=('wind_speed', 'mean'),
+        n=('sunshine_hour', 'sum'),
+        pressure=('pressure', 'mean'))
+    df.insert(0, 'date', df.index)
+
+    return df
+
+
+def partial_aggregates(data):
+    """
+    Running aggregates of hourly weather data per location and date, which
+    can be combined with the aggregates of later hourly data
+
+    Args:
+        data (pandas.Dataframe): dataframe with validated hourly weather data
+
+    Returns:
+        partial (pandas.Dataframe): dataframe with aggregates, indexed by
+        'lat', 'lon' and 'date'
+    """
+    data = data.assign(sunshine_hour=sunshine_hours(data))
+
+    aggregates = dict(
+        hours=('temp', 'size'),
+        Tmin=('temp', 'min'),
+        Tmax=('temp', 'max'),
+        temp_sum=('temp', 'sum'),
+        RHmin=('humidity', 'min'),
+        RHmax=('humidity', 'max'),
+        wind_sum=('wind_speed', 'sum'),
+        n=('sunshine_hour', 'sum'),
+        pressure_sum=('pressure', 'sum'))
+    if 'altitude' in data.columns:
+        aggregates['z'] = ('altitude', 'min')
+
+    return data.groupby(['lat', 'lon', 'date']).agg(**aggregates)
+
+
+# How running aggregates of the same location and date are combined
+COMBINE = {'hours': 'sum', 'Tmin': 'min', 'Tmax': 'max', 'temp_sum': 'sum',
+           'RHmin': 'min', 'RHmax': 'max', 'wind_sum': 'sum', 'n': 'sum',
+           'pressure_sum': 'sum', 'z': 'min'}
+
+
+def combine_aggregates(state, partial):
+    """
+    Combine running aggregates with the aggregates of new hourly data
+
+    Args:
+        state (pandas.Dataframe): running aggregates or None
+        partial (pandas.Dataframe): aggregates of new hourly data
+
+    Returns:
+        state (pandas.Dataframe): combined running aggregates
+    """
+    if state is None or state.empty:
+        return partial
+
+    combined = pd.concat([state, partial])
+    functions = {column: COMBINE[column] for column in combined.columns}
+
+    return combined.groupby(level=['lat', 'lon', 'date']).agg(functions)
+
+
+def finish_aggregates(state):
+    """
+    Convert running aggregates of complete days to daily weather data
+
+    Args:
+        state (pandas.Dataframe): running aggregates of complete days
+
+    Returns:
+        df (pandas.Dataframe): dataframe with daily weather data
+    """
+    state = state.sort_index().reset_index()
+
     df = pd.DataFrame({
-        "date": data['date'].unique(),
-        "lat": data.groupby('date')['lat'].min(),
-        "lon": data.groupby('date')['lon'].min(),
-        "Tmin": data.groupby('date')['temp'].min(),
-        "Tmax" : data.groupby('date')['temp'].max(),
-        "Tmean" : data.groupby('date')['temp'].mean(),
-        "RHmin" :data.groupby('date')['humidity'].min(),
-        "RHmax" : data.groupby('date')['humidity'].max(),
-        "uz" : data.groupby('date')['wind_speed'].mean(),
-        "n" :data.groupby('date')['sunshine_hour'].min(),
-        "pressure" : data.groupby('date')['pressure'].mean()
+        "date": state['date'],
+        "lat": state['lat'],
+        "lon": state['lon'],
+        "Tmin": state['Tmin'],
+        "Tmax": state['Tmax'],
+        "Tmean": state['temp_sum'] / state['hours'],
+        "RHmin": state['RHmin'],
+        "RHmax": state['RHmax'],
+        "uz": state['wind_sum'] / state['hours'],
+        "n": state['n'],
+        "pressure": state['pressure_sum'] / state['hours'],
+        "doy": state['date'].dt.dayofyear
     })
+    if 'z' in state.columns:
+        df['z'] = state['z']
+
+    return df
+
+
+def stream(file, result, chunksize, logger):
+    """
+    Aggregate hourly weather data per location and day while reading the file
+    in chunks. A day of a location is complete, and written to the result
+    file, once hourly data of a later day of that location is read.
+
+    Args:
+        file (str): filepath of input file, hourly records of a location in
+        chronological order
+        result (str): filepath of result file
+        chunksize (int): number of hourly records read per chunk
+
+    Returns:
+        days (int): number of days written to the result file
+    """
+    try:
+        reader = table_io.read_chunks(file, chunksize,
+                                      columns=lambda column: column in HOURLY_COLUMNS)
+    except FileNotFoundError:
+        logger.info(f"File '{file}' not found. \n")
+        sys.exit(1)
+    except IOError as e:
+        logger.info(f"An error occurred while reading the file: {e} \n")
+        sys.exit(1)
+
+    state = None
+    last_written = {}
+    days = 0
+
+    with table_io.TableWriter(result) as output:
+
+        def write(complete):
+            nonlocal days
+            df = finish_aggregates(complete)
+            for location, date in zip(zip(df['lat'], df['lon']), df['date']):
+                if location in last_written and date <= last_written[location]:
+                    logger.warning(f"Day {date.date()} of location {location} was already "
+                                   "written, hourly data is not in chronological order \n")
+                last_written[location] = date
+            output.write(df)
+            days += len(df)
+
+        for chunk in reader:
+            data = prepare_data(chunk, logger)
+            state = combine_aggregates(state, partial_aggregates(data))
+
+            # Days before the last day of a location are complete
+            dates = state.reset_index(level='date')['date']
+            last_date = dates.groupby(level=['lat', 'lon']).transform('max')
+            complete = (dates < last_date).to_numpy()
+
+            if complete.any():
+                write(state[complete])
+            state = state[~complete]
+
+        if state is not None and not state.empty:
+            write(state)
+
+    return days
+
+
+def main():
+    """
+    Main function of this script processing weather data to dataframe with only
+    validated instances.
+    """
+
+    # Configure logger
+    logger = configure_logger()
+
+    # Log the start of the main script
+    logger.info("Main script started.\n")
+
+    # Parse arguments
+    args = parse_args()
+    logger.info(f"Using input file: {args.file} \n")
+
+    if args.stream:
+        # Aggregate per location and day while reading the file
+        days = stream(args.file, args.result, args.chunksize, logger)
+        logger.info(f"Result of {days} days saved in {args.result} \n")
+        logger.info("Main script finished.")
+        logging.shutdown()
+        return 0
+
+    # Read file to dataframe
+    df = read_data(args.file, logger)
+
+    # Validate and convert hourly data
+    data = prepare_data(df, logger)
+
+    # Aggregate hourly data per day
+    df = daily_aggregates(data)
 
     # Add a new column 'day_of_year'
-    df['doy'] = df['date'].apply(lambda x: x.timetuple().tm_yday)
+    df['doy'] = df['date'].dt.dayofyear
 
-    # Save to CSV file
-    df.to_csv(args.result, index=False)
+    # Save to result file
+    table_io.write_table(df, args.result)
     logger.info(f"Result saved in {args.result} \n" )
 
     # Log the end of the main script
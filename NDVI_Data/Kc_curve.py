@@ -10,15 +10,119 @@ Version:1.1
 """
 
 # Imports
+import os
 import sys
+import json
+import hashlib
+from dataclasses import dataclass
 import pwlf
 import numpy as np
-import pandas as pd
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Constants
+SEGMENTS = 5
+MIN_POINTS = 3
+ENGINES = ('dp', 'pwlf')
+CACHE_VERSION = 1
+CACHE_SIZE = 10000
+CACHE_EVICT = 0.1
+
+
 # Functions
+def segment_costs(x, y, min_points=MIN_POINTS):
+    """
+    Sum of squared errors of a linear least squares fit through every range of
+    points, calculated from prefix sums. Neighbouring segments share their
+    boundary point.
+
+    Args:
+        x (np.array): array with x values in ascending order
+        y (np.array): array with y values
+        min_points (int): minimum number of points in a segment
+
+    Returns:
+        costs (np.array): n x n array where costs[i, j] is the error of the
+        line through points i up to and including j, infinite for ranges with
+        less than min_points points
+    """
+    # Centre values to limit rounding errors in the sums
+    x = x - x.mean()
+    y = y - y.mean()
+
+    zero = np.zeros(1)
+    s_1 = np.concatenate([zero, np.cumsum(np.ones_like(x))])
+    s_x = np.concatenate([zero, np.cumsum(x)])
+    s_y = np.concatenate([zero, np.cumsum(y)])
+    s_xx = np.concatenate([zero, np.cumsum(x * x)])
+    s_xy = np.concatenate([zero, np.cumsum(x * y)])
+    s_yy = np.concatenate([zero, np.cumsum(y * y)])
+
+    def range_sum(prefix):
+        # Sum of points i up to and including j for all i, j
+        return prefix[None, 1:] - prefix[:-1, None]
+
+    n = range_sum(s_1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sxx = range_sum(s_xx) - range_sum(s_x) ** 2 / n
+        sxy = range_sum(s_xy) - range_sum(s_x) * range_sum(s_y) / n
+        syy = range_sum(s_yy) - range_sum(s_y) ** 2 / n
+        costs = np.where(sxx > 0, syy - sxy ** 2 / sxx, 0)
+
+    costs = np.maximum(costs, 0)
+    costs[np.tril_indices(len(x), k=min_points - 2)] = np.inf
+
+    return costs
+
+
+def dp_function(doy, ndvi, segments=SEGMENTS):
+    """
+    Find breakpoints in the curve day in the year against NDVI values with
+    an exact dynamic programming segmentation. Each segment is a least squares
+    line, the breakpoints are the days minimizing the total squared error.
+    The result is deterministic and breakpoints are always days in the data.
+
+    Args:
+        doy (np.array): array including day in the year values
+        ndvi (np.array): array including NDVI values
+        segments (int): number of line segments
+
+    Returns:
+        breakpoints (list): list with the breakpoints in the Kc curve
+        between the growth stages
+    """
+    order = np.argsort(doy, kind='stable')
+    x = np.asarray(doy, dtype=float)[order]
+    y = np.asarray(ndvi, dtype=float)[order]
+
+    needed = segments * (MIN_POINTS - 1) + 1
+    if len(x) < needed:
+        raise ValueError(f"At least {needed} points are needed "
+                         f"for {segments} segments, got {len(x)}")
+
+    costs = segment_costs(x, y)
+
+    # error[j] is the lowest error of k segments over points 0 up to j,
+    # start[k][j] the first point of the last of those segments
+    error = costs[0]
+    start = []
+    for _ in range(1, segments):
+        total = error[:, None] + costs
+        start.append(np.argmin(total, axis=0))
+        error = np.min(total, axis=0)
+
+    # Trace back the breakpoints from the last point
+    indices = [len(x) - 1]
+    for previous in reversed(start):
+        indices.append(previous[indices[-1]])
+    indices.append(0)
+
+    breakpoints = [round(x[i]) for i in reversed(indices)]
+
+    return breakpoints
+
+
 def pwlf_function(doy, ndvi):
     """
     initialize piecewise linear fit to find breakpoints in the curve day in the
@@ -37,7 +141,7 @@ def pwlf_function(doy, ndvi):
     my_pwlf = pwlf.PiecewiseLinFit(doy, ndvi)
 
     # fit the data for 4 line segments
-    my_pwlf.fit(5)
+    my_pwlf.fit(SEGMENTS)
 
     # find breakpoints in curve
     breakpoints = [round(point) for point in my_pwlf.fit_breaks]
@@ -45,6 +149,28 @@ def pwlf_function(doy, ndvi):
     return breakpoints
 
 
+def find_breakpoints(doy, ndvi, engine='dp'):
+    """
+    Find breakpoints with the selected engine
+
+    Args:
+        doy (np.array): array including day in the year values
+        ndvi (np.array): array including NDVI values
+        engine (str): 'dp' for dynamic programming, 'pwlf' for the
+        piecewise linear fit of pwlf
+
+    Returns:
+        breakpoints (list): list with the breakpoints in the Kc curve
+        between the growth stages
+    """
+    if engine == 'dp':
+        return dp_function(doy, ndvi)
+    if engine == 'pwlf':
+        return pwlf_function(doy, ndvi)
+
+    raise ValueError(f"Unknown breakpoint engine '{engine}', choose from {ENGINES}")
+
+
 def level_curve(curve):
     """
     Level the values between the breakpoints of the curve to get a Kc curve
@@ -76,72 +202,311 @@ def level_curve(curve):
     return curve
 
 
-def interpolate(curve):
+@dataclass(frozen=True)
+class KcCurve:
     """
-    augmentation of data points between break points in curve
-    through interpolate for days that are not in dataframe
+    Kc curve defined by the day in the year and Kc value of its breakpoints,
+    the Kc value between breakpoints is linearly interpolated
 
     Args:
-        curve (dict): dictionary with day in the year and Kc value for breakpoints
+        days (np.array): array with day in the year of the breakpoints
+        values (np.array): array with Kc value of the breakpoints
+    """
+    days: np.ndarray
+    values: np.ndarray
+
+    def __post_init__(self):
+        for name in ('days', 'values'):
+            array = np.array(getattr(self, name), dtype=float)
+            array.setflags(write=False)
+            object.__setattr__(self, name, array)
+
+    @classmethod
+    def from_dict(cls, curve):
+        """
+        Create Kc curve from a dictionary with day in the year and Kc value
+        for breakpoints
+        """
+        return cls(list(curve.keys()), list(curve.values()))
 
-    Returns:
-        merged (pandas.Dataframe): dataframe with day in the year and
-        belonging Kc value
+    def to_dict(self):
+        """
+        Dictionary with day in the year and Kc value for breakpoints
+        """
+        return {int(day): float(value) for day, value in zip(self.days, self.values)}
+
+    @property
+    def start(self):
+        return self.days[0]
+
+    @property
+    def end(self):
+        return self.days[-1]
+
+    def __call__(self, doy):
+        """
+        Kc value at days in the year, NaN outside the curve
+
+        Args:
+            doy (np.array): array including day in the year values
+
+        Returns:
+            (np.array): array with Kc values
+        """
+        return np.interp(np.asarray(doy, dtype=float), self.days, self.values,
+                         left=np.nan, right=np.nan)
+
+
+class KcCache:
+    """
+    Persistent cache of Kc curves, one JSON file per curve in a directory.
+    Curves are keyed by a hash of the day in the year and NDVI values and the
+    fit parameters, the least recently used curves are removed when the cache
+    holds more than max_entries curves. A tenth of the curves is removed at
+    once, so the directory is not scanned at every new curve of a full cache.
+
+    The curves are counted once when the cache is created and the count is
+    kept up to date, the directory is only scanned again to evict. A cache
+    sent to a worker process is created there once and reused by all its
+    tasks; each process counts its own curves, so with several processes the
+    cache can briefly hold more than max_entries curves.
+
+    Args:
+        directory (str): directory of the cache files
+        max_entries (int): maximum number of curves in the cache
     """
-    # Generate a range of days from the minimum to the maximum
-    df = pd.DataFrame(list(curve.items()), columns=['doy', 'Kc'])
 
-    full_range = pd.DataFrame({'doy': range(df['doy'].min(), df['doy'].max() + 1)})
+    def __init__(self, directory, max_entries=CACHE_SIZE):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.entries = len(self._scan())
+
+    def __reduce__(self):
+        return shared_cache, (self.directory, self.max_entries)
+
+    def key(self, doy, ndvi, engine):
+        """
+        Hash of the NDVI series and the fit parameters
+
+        Args:
+            doy (np.array): array including day in the year values
+            ndvi (np.array): array including NDVI values
+            engine (str): breakpoint engine
+
+        Returns:
+            (str): hexadecimal sha256 hash
+        """
+        params = json.dumps({'engine': engine, 'segments': SEGMENTS,
+                             'min_points': MIN_POINTS, 'version': CACHE_VERSION})
+        digest = hashlib.sha256(params.encode())
+        digest.update(np.ascontiguousarray(doy, dtype=np.float64).tobytes())
+        digest.update(np.ascontiguousarray(ndvi, dtype=np.float64).tobytes())
+
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _scan(self):
+        try:
+            return [entry for entry in os.scandir(self.directory)
+                    if entry.name.endswith('.json')]
+        except OSError:
+            return []
+
+    def get(self, key):
+        """
+        Get breakpoints and levelled curve from the cache
+
+        Args:
+            key (str): key of the curve
+
+        Returns:
+            breakpoints (list): list with the breakpoints, None when not cached
+            curve (KcCurve): levelled Kc curve, None when not cached
+        """
+        path = self._path(key)
+        try:
+            with open(path) as file:
+                entry = json.load(file)
+            # Mark as recently used
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None, None
+
+        self.hits += 1
+        days, values = zip(*entry['curve'])
+
+        return entry['breakpoints'], KcCurve(days, values)
+
+    def put(self, key, breakpoints, curve):
+        """
+        Store breakpoints and levelled curve in the cache and remove the least
+        recently used curves when the cache is full
+
+        Args:
+            key (str): key of the curve
+            breakpoints (list): list with the breakpoints
+            curve (KcCurve): levelled Kc curve
+        """
+        entry = {'breakpoints': [int(point) for point in breakpoints],
+                 'curve': [[day, value] for day, value in curve.to_dict().items()]}
+
+        path = self._path(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as file:
+                json.dump(entry, file)
+            new = not os.path.exists(path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write Kc curve to cache {path}: {e}")
+            return
+
+        self.entries += new
+        if self.entries > self.max_entries:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used curves when there are more than
+        max_entries, down to CACHE_EVICT below max_entries, and count the
+        curves that are left
+        """
+        entries = self._scan()
+        self.entries = len(entries)
+        if len(entries) <= self.max_entries:
+            return
+
+        keep = self.max_entries - int(self.max_entries * CACHE_EVICT)
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - keep]:
+            try:
+                os.remove(entry.path)
+                self.entries -= 1
+            except OSError:
+                continue
+
+
+# Cache per directory in this process, used by caches sent to worker processes
+shared_caches = {}
+
+
+def shared_cache(directory, max_entries):
+    """
+    Get the cache of a directory in this process, created on first use
 
-    # Merge to include all days in the range
-    merged = pd.merge(df, full_range, on='doy', how='right')
+    Args:
+        directory (str): directory of the cache files
+        max_entries (int): maximum number of curves in the cache
 
-    # Interpolate the 'average' column
-    merged['Kc'] = merged['Kc'].interpolate()
+    Returns:
+        (KcCache): cache of Kc curves
+    """
+    key = (directory, max_entries)
+    if key not in shared_caches:
+        shared_caches[key] = KcCache(directory, max_entries)
 
-    return merged
+    return shared_caches[key]
 
 
-def main(df, logger):
+def ndvi_lookup(doy, ndvi):
     """
-    Main function of this script, calculating Kc value for each date in
-    pandas dataframe
+    Create lookup of NDVI values by day in the year, using the first value of
+    days that occur more than once
 
     Args:
-        df(pandas.Dataframe): dataframe with meteorological information
+        doy (np.array): array including day in the year values
+        ndvi (np.array): array including NDVI values
 
     Returns:
-        new_df(pandas.Dataframe): dataframe with meterological information,
-        ET0 and Kc value.
+        lookup (function): function returning the NDVI values of an array of days
     """
-    
-    logger.info("Kc curve calculation started. \n")
+    days, first = np.unique(doy, return_index=True)
+    values = np.asarray(ndvi, dtype=float)[first]
+
+    def lookup(day):
+        index = np.minimum(np.searchsorted(days, day), len(days) - 1)
+        if np.any(days[index] != day):
+            raise KeyError(f"Days {day} are not all in the NDVI data")
+        return values[index]
+
+    return lookup
+
+
+def kc_curve(df, engine='dp'):
+    """
+    Find breakpoints in the NDVI values and convert them to a levelled Kc curve
+
+    Args:
+        df(pandas.Dataframe): dataframe with 'doy' and 'NDVI' values
+        engine (str): breakpoint engine, 'dp' or 'pwlf'
 
+    Returns:
+        breakpoints (list): list with the breakpoints in the Kc curve
+        curve (KcCurve): levelled Kc curve
+    """
     doy = np.array(df['doy'])
     ndvi = np.array(df['NDVI'])
 
-    breakpoints = pwlf_function(doy,ndvi)
+    breakpoints = find_breakpoints(doy, ndvi, engine)
 
     # Convert NDVI to Kc value
-    curve = {}
-    for i in breakpoints:
-        curve[int(round(i))] = 1.25 * df.loc[df['doy'] == int(round(i)), 'NDVI'].values[0] + 0.2
+    days = [int(round(i)) for i in breakpoints]
+    kc = 1.25 * ndvi_lookup(doy, ndvi)(days) + 0.2
+    curve = dict(zip(days, kc.tolist()))
 
     # Level line segments in curve
     curve = level_curve(curve)
 
-    # Interpolate points in line segment
-    merged = interpolate(curve)
+    return breakpoints, KcCurve.from_dict(curve)
+
+
+def main(df, logger, engine='dp', cache=None):
+    """
+    Main function of this script, calculating Kc value for each date in
+    pandas dataframe
+
+    Args:
+        df(pandas.Dataframe): dataframe with meteorological information
+        engine (str): breakpoint engine, 'dp' or 'pwlf'
+        cache (KcCache): cache of Kc curves or None
+
+    Returns:
+        new_df(pandas.Dataframe): dataframe with meterological information,
+        ET0 and Kc value for the days between the first and last breakpoint.
+    """
+    
+    logger.info("Kc curve calculation started. \n")
+
+    if cache is None:
+        breakpoints, curve = kc_curve(df, engine)
 
-    # Add Kc values to existing dataframe
-    new_df = pd.merge(df, merged, on='doy', how='right')
+    else:
+        key = cache.key(df['doy'], df['NDVI'], engine)
+        breakpoints, curve = cache.get(key)
+
+        if curve is None:
+            logger.info(f"Kc curve cache miss: {key} \n")
+            breakpoints, curve = kc_curve(df, engine)
+            cache.put(key, breakpoints, curve)
+        else:
+            logger.info(f"Kc curve cache hit: {key} \n")
+
+    # Add Kc values of the days within the curve to the dataframe
+    doy = df['doy'].to_numpy()
+    new_df = df[(doy >= curve.start) & (doy <= curve.end)].reset_index(drop=True)
+    new_df['Kc'] = curve(new_df['doy'])
     
     logger.info("Kc curve calculation completed. \n")
 
     return new_df
 
 
-
 if __name__ == "__main__":
     try:
         main()
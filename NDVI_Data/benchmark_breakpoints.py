@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+benchmark_breakpoints
+Description: compare speed and breakpoint agreement of the breakpoint engines
+in Kc_curve on seasons shaped like the NDVI series of sample.csv
+Author: Susan Reefman
+Date: 16/10/2026
+Version: 1.0
+"""
+
+# Imports
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+import Kc_curve
+
+# Shared modules of the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import table_io
+
+
+def parse_args():
+    """
+    parse command-line arguments for the input file and benchmark size
+
+    Returns:
+        parser.parse_args()
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-f", "--file",
+                        help="""The location and name of a CSV, Parquet or Feather file
+                        with doy and NDVI columns of one season""",
+                        required=True)
+    parser.add_argument("-n", "--seasons", type=int, default=10,
+                        help="""Number of seasons to benchmark""")
+    parser.add_argument("-s", "--seed", type=int, default=42,
+                        help="""Seed of the noise added to the seasons""")
+    return parser.parse_args()
+
+
+def make_seasons(doy, ndvi, number, seed):
+    """
+    Create seasons by adding noise to the NDVI values of one season, the
+    first season is the original one
+
+    Args:
+        doy (np.array): array including day in the year values
+        ndvi (np.array): array including NDVI values
+        number (int): number of seasons
+        seed (int): seed of the random generator
+
+    Returns:
+        seasons (list): list with (doy, ndvi) tuples
+    """
+    rng = np.random.default_rng(seed)
+    seasons = [(doy, ndvi)]
+    for _ in range(number - 1):
+        noise = rng.normal(0, 0.01, len(ndvi))
+        seasons.append((doy, np.round(ndvi + noise, 3)))
+
+    return seasons
+
+
+def run_engine(engine, seasons):
+    """
+    Find breakpoints of all seasons with one engine
+
+    Args:
+        engine (str): breakpoint engine
+        seasons (list): list with (doy, ndvi) tuples
+
+    Returns:
+        breakpoints (list): list with breakpoints per season
+        seconds (float): total run time
+    """
+    start = time.perf_counter()
+    breakpoints = [Kc_curve.find_breakpoints(doy, ndvi, engine)
+                   for doy, ndvi in seasons]
+    seconds = time.perf_counter() - start
+
+    return breakpoints, seconds
+
+
+def main():
+    """
+    Main function of this script, printing run time per season of each engine
+    and the difference in days between the breakpoints of the engines
+    """
+    args = parse_args()
+
+    df = table_io.read_table(args.file, columns=['doy', 'NDVI'])
+    seasons = make_seasons(np.array(df['doy']), np.array(df['NDVI']),
+                           args.seasons, args.seed)
+
+    results = {}
+    for engine in Kc_curve.ENGINES:
+        results[engine], seconds = run_engine(engine, seasons)
+        print(f"{engine:>5}: {seconds / len(seasons) * 1000:10.2f} ms per season")
+
+    # Difference in days of the inner breakpoints, first and last are the data range
+    differences = np.array([np.abs(np.subtract(dp[1:-1], pw[1:-1]))
+                            for dp, pw in zip(results['dp'], results['pwlf'])])
+    print(f"Breakpoint difference dp - pwlf: mean {differences.mean():.2f} days, "
+          f"max {differences.max()} days")
+    print(f"Seasons with all breakpoints within 3 days: "
+          f"{np.sum(differences.max(axis=1) <= 3)}/{len(seasons)}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\nScript terminated by the user.")
+        sys.exit(1)
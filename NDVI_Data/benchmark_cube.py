@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+benchmark_cube
+Description: compare speed and results of the block processing of ndvi_cube
+with the per-pixel reference on a sample of pixels of an NDVI cube
+Author: Susan Reefman
+Date: 17/10/2026
+Version: 1.0
+"""
+
+# Imports
+import sys
+import time
+import argparse
+import numpy as np
+
+import ndvi_cube
+
+
+def parse_args():
+    """
+    parse command-line arguments for the input cube and sample size
+
+    Returns:
+        parser.parse_args()
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--cube",
+                        help="""The location and name of the NDVI cube in .npy format,
+                        with shape time x rows x cols""",
+                        required=True)
+    parser.add_argument("-d", "--doy",
+                        help="""The location and name of the day in the year of each
+                        raster in the cube in .npy format""",
+                        required=True)
+    parser.add_argument("-n", "--pixels", type=int, default=1000,
+                        help="""Number of pixels to compare""")
+    parser.add_argument("-s", "--seed", type=int, default=42,
+                        help="""Seed of the pixel sample""")
+    return parser.parse_args()
+
+
+def compare(grid, failed, reference):
+    """
+    Compare the result of one pixel with the per-pixel reference
+
+    Args:
+        grid (np.array): NDVI value per day of process_block
+        failed (bool): True when process_block could not process the pixel
+        reference (np.array): result of process_pixel, None when it could not
+        process the pixel
+
+    Returns:
+        (float): largest difference, infinite when the days or failures differ
+    """
+    if reference is None or failed:
+        return 0.0 if reference is None and failed else np.inf
+    if not np.array_equal(np.isnan(grid), np.isnan(reference)):
+        return np.inf
+
+    mask = ~np.isnan(reference)
+    return float(np.abs(grid[mask] - reference[mask]).max(initial=0))
+
+
+def main():
+    """
+    Main function of this script, printing run time per pixel of both methods
+    and the largest difference between them
+    """
+    args = parse_args()
+
+    cube = np.load(args.cube, mmap_mode='r')
+    doy = np.load(args.doy).astype(float)
+
+    # Sample of pixels as columns of a block
+    rng = np.random.default_rng(args.seed)
+    pixels = rng.choice(cube.shape[1] * cube.shape[2],
+                        size=min(args.pixels, cube.shape[1] * cube.shape[2]), replace=False)
+    rows, cols = np.unravel_index(pixels, cube.shape[1:])
+    block = np.asarray(cube[:, rows, cols], dtype=float)
+
+    start = time.perf_counter()
+    grid, failed = ndvi_cube.process_block(doy, block)
+    block_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    references = [ndvi_cube.process_pixel(doy, block[:, i]) for i in range(len(pixels))]
+    pixel_seconds = time.perf_counter() - start
+
+    differences = np.array([compare(grid[:, i], failed[i], reference)
+                            for i, reference in enumerate(references)])
+
+    print(f"block: {block_seconds / len(pixels) * 1000:10.3f} ms per pixel")
+    print(f"pixel: {pixel_seconds / len(pixels) * 1000:10.3f} ms per pixel")
+    print(f"Largest difference: {differences.max():.2e}, "
+          f"pixels that differ: {np.sum(differences > 1e-9)}/{len(pixels)}")
+
+    return 0 if np.all(differences <= 1e-9) else 1
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print("\nScript terminated by the user.")
+        sys.exit(1)
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ndvi_cube
+Description: Processing of NDVI values per pixel. A stack of NDVI rasters,
+stored as a memory-mapped NumPy array (time x rows x cols), is processed in
+spatial tiles with the functions of ndvi_processing, all pixels of a tile at
+once. The result is a
+memory-mapped cube with an NDVI value per day in the year for every pixel.
+Author: Susan Reefman
+Date: 16/10/2026
+Version: 1.0
+"""
+
+# Importing
+import os
+import sys
+import argparse
+import logging
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.signal import savgol_filter
+
+import ndvi_processing
+
+# Constants
+DAYS = 366
+TILE_SIZE = 128
+
+
+def parse_args():
+    """
+    parse command-line arguments for input and output files
+
+    Returns:
+        parser.parse_args()
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--cube",
+                        help="""The location and name of the NDVI cube in .npy format,
+                        with shape time x rows x cols""",
+                        required=True)
+    parser.add_argument("-d", "--doy",
+                        help="""The location and name of the day in the year of each
+                        raster in the cube in .npy format""",
+                        required=True)
+    parser.add_argument("-r", "--result",
+                        help="""The location and name result cube in .npy format""",
+                        required=True)
+    parser.add_argument("-t", "--tile", type=int, default=TILE_SIZE,
+                        help="""Number of rows and columns of a tile""")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                        help="""Number of processes calculating tiles in parallel""")
+    return parser.parse_args()
+
+
+def configure_logger():
+    """
+    Create logger to store information with a specified log file
+
+    Returns:
+        logger (logging.Logger): The configured logger instance.
+    """
+    # Create a logger
+    logger = logging.getLogger(__name__)
+    logger.setLevel(logging.DEBUG)
+
+    # Check if handlers already exist to avoid duplication
+    if not logger.handlers:
+        # Create a file handler
+        file_handler = logging.FileHandler('NDVI_cube_log.log')
+        file_handler.setLevel(logging.DEBUG)
+
+        # Create a formatter and set the formatter for the handler
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        file_handler.setFormatter(formatter)
+
+        # Add the handler to the logger
+        logger.addHandler(file_handler)
+
+    return logger
+
+
+def process_pixel(doy, values):
+    """
+    Process the NDVI series of one pixel to an NDVI value per day in the year.
+    Where the left and right side of the curve both contain a day, the value
+    of the left side is used. Reference of process_block for one pixel.
+
+    Args:
+        doy (np.array): array with day in the year values
+        values (np.array): array with NDVI values
+
+    Returns:
+        grid (np.array): array with an NDVI value per day in the year, index 0
+        is day 1, NaN for days outside the growth cycle. None when the series
+        can not be processed.
+    """
+    grid = np.full(DAYS, np.nan)
+    if not np.any(ndvi_processing.nonzero_mask(values)):
+        return grid
+
+    try:
+        _, left, right = ndvi_processing.process_series(doy, values)
+    except ValueError:
+        # Too few values to smooth
+        return None
+
+    days_l, interpolated_l = ndvi_processing.interpolate_array(*left)
+    days_r, interpolated_r = ndvi_processing.interpolate_array(*right)
+    days = np.concatenate([days_l, days_r]).astype(int)
+    interpolated = np.concatenate([interpolated_l, interpolated_r])
+
+    # First value of each day within the year
+    days, first = np.unique(days, return_index=True)
+    in_year = (days >= 1) & (days <= DAYS)
+    grid[days[in_year] - 1] = interpolated[first[in_year]]
+
+    return grid
+
+
+def compact(mask, *arrays):
+    """
+    Move the values of each column where mask is True to the top of the
+    column, keeping their order
+
+    Args:
+        mask (np.array): 2-D boolean array (time x pixels)
+        arrays (np.array): 2-D arrays with the shape of mask
+
+    Returns:
+        lengths (np.array): number of values per column
+        compacted (list): array per input array, NaN below the values
+    """
+    rows, cols = np.nonzero(mask)
+    position = (np.cumsum(mask, axis=0) - 1)[rows, cols]
+
+    compacted = []
+    for array in arrays:
+        result = np.full(mask.shape, np.nan)
+        result[position, cols] = array[rows, cols]
+        compacted.append(result)
+
+    return mask.sum(axis=0), compacted
+
+
+def smooth(values, lengths):
+    """
+    Savitzky-Golay filter with window 3 and order 1 of the series in the
+    columns of values, each series of its own length
+
+    Args:
+        values (np.array): 2-D array (time x pixels), NaN below each series
+        lengths (np.array): length of the series per column, at least 3
+
+    Returns:
+        smoothed (np.array): 2-D array with the smoothed series
+    """
+    # The edge fit does not accept NaN, values after a series are not used
+    smoothed = savgol_filter(np.nan_to_num(values), window_length=3, polyorder=1, axis=0)
+
+    # The filter fits a line to the last 3 values of a series ending above the
+    # bottom of the array, like at the end of the array
+    cols = np.arange(values.shape[1])
+    last = [values[lengths - k, cols] for k in (3, 2, 1)]
+    smoothed[lengths - 1, cols] = (-last[0] + 2 * last[1] + 5 * last[2]) / 6
+
+    return smoothed
+
+
+def drops_left(values, doy, lengths):
+    """
+    Remove drops in the left side of the curves in the columns of values
+
+    Args:
+        values (np.array): 2-D array (time x pixels) with NDVI values up to the
+        maximum, NaN below each series
+        doy (np.array): 2-D array with the day in the year of values
+        lengths (np.array): length of the series per column
+
+    Returns:
+        values (np.array): 2-D array with NDVI values without drops
+        doy (np.array): 2-D array with the day in the year of values
+    """
+    # Values after a series do not change the indices of the series
+    index = ndvi_processing.drops_left_index(values.T).T
+    below = np.arange(values.shape[0])[:, None] >= lengths
+
+    values = np.where(below, np.nan, np.take_along_axis(values, index, axis=0))
+    doy = np.where(below, np.nan, np.take_along_axis(doy, index, axis=0))
+
+    return values, doy
+
+
+def drops_right(values, doy, lengths):
+    """
+    Remove drops in the right side of the curves in the columns of values
+
+    Args:
+        values (np.array): 2-D array (time x pixels) with NDVI values from the
+        maximum, NaN below each series
+        doy (np.array): 2-D array with the day in the year of values
+        lengths (np.array): length of the series per column
+
+    Returns:
+        values (np.array): 2-D array with NDVI values without drops, NaN
+        below each series
+        doy (np.array): 2-D array with the day in the year of values
+        lengths (np.array): length of the series without drops per column
+    """
+    # Comparisons with NaN are False, a drop never starts or ends after a series
+    indices = ndvi_processing.drops_right_index(values.T)
+    cols = np.repeat(np.arange(values.shape[1]), [len(index) for index in indices])
+    index = np.concatenate(indices)
+
+    # Indices after the series come from the values after it
+    keep = index < lengths[cols]
+    cols, index = cols[keep], index[keep]
+    lengths = np.bincount(cols, minlength=values.shape[1])
+    position = np.arange(len(cols)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    size = max(values.shape[0], lengths.max(initial=0))
+    new_values = np.full((size, values.shape[1]), np.nan)
+    new_doy = np.full((size, values.shape[1]), np.nan)
+    new_values[position, cols] = values[index, cols]
+    new_doy[position, cols] = doy[index, cols]
+
+    return new_values, new_doy, lengths
+
+
+def process_block(doy, block):
+    """
+    Process the NDVI series of all pixels of a block to an NDVI value per day
+    in the year, with the steps of process_series on the whole block. Only the
+    interpolation is done per pixel.
+
+    Args:
+        doy (np.array): array with the day in the year of each raster
+        block (np.array): 2-D array (time x pixels) with NDVI values
+
+    Returns:
+        grid (np.array): 2-D array (DAYS x pixels) with an NDVI value per day in
+        the year, index 0 is day 1, NaN for days outside the growth cycle
+        failed (np.array): boolean array, True for pixels that could not be
+        processed
+    """
+    doy = np.asarray(doy, dtype=float)
+    block = np.asarray(block, dtype=float)
+    pixels = block.shape[1]
+    days = np.broadcast_to(doy[:, None], block.shape)
+    grid = np.full((DAYS, pixels), np.nan)
+
+    # Remove values below 0.1
+    nonzero = ndvi_processing.nonzero_mask(block)
+    valid = nonzero.any(axis=0)
+
+    # Crop growth cycle of 160 days around the first maximum
+    masked = np.where(nonzero, block, -np.inf)
+    peak = np.argmax(masked, axis=0)
+    peak_doy = doy[peak]
+    end = np.where(peak_doy + 85 > 365,
+                   np.where(nonzero, days, -np.inf).max(axis=0), peak_doy + 85)
+    mask = nonzero & (days >= peak_doy - 75) & (days <= end)
+
+    lengths, (values, series_doy) = compact(mask, block, days)
+    peak = np.argmax(np.where(np.isnan(values), -np.inf, values), axis=0)
+
+    # Left side up to and including the maximum
+    rows = np.arange(values.shape[0])[:, None]
+    left = rows <= peak
+    left_values, left_doy = drops_left(np.where(left, values, np.nan),
+                                       np.where(left, series_doy, np.nan), peak + 1)
+    left_lengths = peak + 1
+
+    # Right side from the maximum, moved to the top
+    index = np.minimum(rows + peak, values.shape[0] - 1)
+    right = rows < lengths - peak
+    right_values, right_doy, right_lengths = drops_right(
+        np.where(right, np.take_along_axis(values, index, axis=0), np.nan),
+        np.where(right, np.take_along_axis(series_doy, index, axis=0), np.nan),
+        np.where(valid, lengths - peak, 0))
+
+    # Too few values to smooth
+    failed = valid & ((left_lengths < 3) | (right_lengths < 3))
+    done = np.flatnonzero(valid & ~failed)
+    if len(done) == 0:
+        return grid, failed
+
+    left_smooth = smooth(left_values[:, done], left_lengths[done])
+    right_smooth = smooth(right_values[:, done], right_lengths[done])
+
+    for k, pixel in enumerate(done):
+        n_left, n_right = left_lengths[pixel], right_lengths[pixel]
+        days_l, interpolated_l = ndvi_processing.interpolate_array(
+            left_doy[:n_left, pixel], left_smooth[:n_left, k])
+        days_r, interpolated_r = ndvi_processing.interpolate_array(
+            right_doy[:n_right, pixel], right_smooth[:n_right, k])
+        pixel_days = np.concatenate([days_l, days_r]).astype(int)
+        interpolated = np.concatenate([interpolated_l, interpolated_r])
+
+        # First value of each day within the year
+        pixel_days, first = np.unique(pixel_days, return_index=True)
+        in_year = (pixel_days >= 1) & (pixel_days <= DAYS)
+        grid[pixel_days[in_year] - 1, pixel] = interpolated[first[in_year]]
+
+    return grid, failed
+
+
+def tiles(rows, cols, size):
+    """
+    Split raster in tiles
+
+    Args:
+        rows (int): number of rows of the raster
+        cols (int): number of columns of the raster
+        size (int): number of rows and columns of a tile
+
+    Returns:
+        (list): list with (first row, last row, first column, last column) of
+        each tile, last row and column are not included
+    """
+    return [(row, min(row + size, rows), col, min(col + size, cols))
+            for row in range(0, rows, size)
+            for col in range(0, cols, size)]
+
+
+def process_tile(cube_file, doy, result_file, tile):
+    """
+    Process all pixels of one tile and write them to the result cube. Only
+    the tile is read into memory.
+
+    Args:
+        cube_file (str): filepath of the NDVI cube
+        doy (np.array): array with the day in the year of each raster
+        result_file (str): filepath of the result cube
+        tile (tuple): first row, last row, first column and last column
+
+    Returns:
+        failed (int): number of pixels that could not be processed
+    """
+    row_start, row_end, col_start, col_end = tile
+
+    cube = np.load(cube_file, mmap_mode='r')
+    block = np.asarray(cube[:, row_start:row_end, col_start:col_end], dtype=float)
+    del cube
+
+    grid, failed = process_block(doy, block.reshape(block.shape[0], -1))
+    output = grid.reshape((DAYS,) + block.shape[1:]).astype(np.float32)
+
+    result = np.load(result_file, mmap_mode='r+')
+    result[:, row_start:row_end, col_start:col_end] = output
+    result.flush()
+    del result
+
+    return int(failed.sum())
+
+
+def main():
+    """
+    Main function of this script processing a cube of NDVI rasters per pixel
+    """
+
+    # Configure logger
+    logger = configure_logger()
+
+    # Log the start of the main script
+    logger.info("NDVI cube processing started.\n")
+
+    args = parse_args()
+    logger.info(f"Using input cube: {args.cube} \n")
+
+    try:
+        cube = np.load(args.cube, mmap_mode='r')
+        doy = np.load(args.doy).astype(float)
+    except (FileNotFoundError, ValueError) as e:
+        logger.info(f"An error occurred while reading the cube: {e} \n")
+        sys.exit(1)
+
+    if cube.ndim != 3 or cube.shape[0] != len(doy):
+        logger.info(f"Cube of shape {cube.shape} does not match {len(doy)} days \n")
+        sys.exit(1)
+
+    _, rows, cols = cube.shape
+    del cube
+
+    # Create result cube on disk, filled by the tiles
+    result = np.lib.format.open_memmap(args.result, mode='w+', dtype=np.float32,
+                                       shape=(DAYS, rows, cols))
+    del result
+
+    tile_list = tiles(rows, cols, args.tile)
+    logger.info(f"Processing {rows} x {cols} pixels in {len(tile_list)} tiles \n")
+
+    if args.workers > 1 and len(tile_list) > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            failed = sum(executor.map(process_tile, repeat(args.cube), repeat(doy),
+                                      repeat(args.result), tile_list))
+    else:
+        failed = sum(process_tile(args.cube, doy, args.result, tile)
+                     for tile in tile_list)
+
+    logger.info(f"Pixels that could not be processed: {failed} \n")
+    logger.info(f"Result cube saved in: {args.result}")
+
+    logger.info("NDVI cube processing completed.")
+
+    # Close the logger handlers to release resources
+    logging.shutdown()
+
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\nScript terminated by the user.")
+        sys.exit(1)
@@ -10,13 +10,26 @@ Version: 1.1
 """
 
 # Importing
+import os
 import sys
+import glob
 import argparse
+import numpy as np
 import pandas as pd
 import logging
-import matplotlib.pyplot as plt
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
 from scipy.signal import savgol_filter 
 
+# Shared modules of the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import table_io
+
+# Constants
+MIN_NDVI = 0.1
+MAX_DROP = 0.2
+
+
 def parse_args():
     """
     parse command-line arguments for input and output files
@@ -26,11 +39,19 @@ def parse_args():
     """
     parser = argparse.ArgumentParser()
     parser.add_argument("-f", "--file",
-                        help="""The location and name to meteorological data in CSV format""",
+                        help="""The location and name to NDVI data in CSV, Parquet
+                        (.parquet) or Feather (.feather) format, or a directory or
+                        glob pattern of these files""",
                         required=True)
     parser.add_argument("-r", "--result",
-                        help="""The location and name result file in CSV format""",
+                        help="""The location and name result file in CSV, Parquet
+                        (.parquet) or Feather (.feather) format, or the result
+                        directory when processing multiple files""",
                         required=True)
+    parser.add_argument("-p", "--plot", action="store_true",
+                        help="""Save a figure of the NDVI curve next to each result file""")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                        help="""Number of processes handling files in parallel""")
     return parser.parse_args()
 
 
@@ -72,7 +93,7 @@ def read_data(file, logger):
     """
 
     try:
-        df = pd.read_csv(file)
+        df = table_io.read_table(file, columns=['doy', 'average'])
 
     except FileNotFoundError:
         logger.info(f"File '{file}' not found. \n")
@@ -84,9 +105,24 @@ def read_data(file, logger):
     return df
 
     
+def nonzero_mask(values):
+    """
+    Mask of the NDVI values above 0.1
+
+    Args:
+        values (np.array): 1-D array with NDVI values, or 2-D array with an
+        NDVI series per row
+
+    Returns:
+        (np.array): boolean array with the shape of values
+    """
+    return np.asarray(values, dtype=float) > MIN_NDVI
+
+
 def remove_zeros(df):
     """ 
-    Remove all average value below 0.1
+    Remove all average value below 0.1. For many series at once,
+    nonzero_mask gives the mask of a 2-D array.
     
     Args:
         df (pandas.DataFrame): dataframe with 'doy' and 'average' NDVI values
@@ -94,55 +130,147 @@ def remove_zeros(df):
     Returns:
         cdf (pandas.DataFrame): dataframe with 'doy' and 'average' NDVI values
     """
-    cdf = pd.DataFrame(columns=['average', 'doy'])
-    for index, row in df.iterrows():
-        avg = df['average'][index]
-        if avg > 0.1:
-            cdf.loc[len(cdf)] = [df['average'][index], df['doy'][index]]
+    mask = nonzero_mask(df['average'])
+    cdf = pd.DataFrame({'average': df['average'].to_numpy(dtype=float)[mask],
+                        'doy': df['doy'].to_numpy(dtype=float)[mask]})
     return cdf
 
 
+def drops_left_index(data):
+    """
+    Index of the value kept at each position when removing drops in the left
+    side of the NDVI curve. A value more than 20% below the last kept value
+    starts a drop, during a drop the last kept value is repeated until a value
+    is at least 80% of the value at the start of the last drop.
+
+    Args:
+        data (np.array): 1-D array with NDVI values, or 2-D array with an
+        NDVI series of equal length per row
+
+    Returns:
+        index (np.array): integer array with the shape of data
+    """
+    data = np.atleast_2d(np.asarray(data, dtype=float))
+    rows = np.arange(data.shape[0])
+
+    index = np.zeros(data.shape, dtype=int)
+    in_drop = np.zeros(data.shape[0], dtype=bool)
+    drop_start_value = data[:, 0].copy()
+
+    for i in range(1, data.shape[1]):
+        value = data[:, i]
+        previous = index[:, i - 1]
+        last_value = data[rows, previous]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            drop_percentage = np.where(last_value != 0,
+                                       (last_value - value) / last_value, 0)
+
+        # Drops continue below 80% of the drop start, new drops start above 20%
+        keep_previous = np.where(in_drop, value < drop_start_value * 0.80,
+                                 drop_percentage > MAX_DROP)
+        drop_ended = in_drop & ~keep_previous
+
+        index[:, i] = np.where(keep_previous, previous, i)
+        drop_start_value = np.where(drop_ended, value, drop_start_value)
+        in_drop = keep_previous
+
+    return index
+
+
+def drops_right_index(data):
+    """
+    Indices of the values kept when removing drops in the right side of the
+    NDVI curve, in the order of remove_continuous_drops_right
+
+    Args:
+        data (np.array): 1-D array with NDVI values, or 2-D array with an
+        NDVI series of equal length per row
+
+    Returns:
+        indices (list): list with an integer array of indices per row
+    """
+    data = np.atleast_2d(np.asarray(data, dtype=float))
+    n_rows, n_values = data.shape
+
+    in_drop = np.zeros(n_rows, dtype=bool)
+    drop_end_index = np.zeros(n_rows, dtype=int)
+    drop_start_value = data[:, 0].copy()
+
+    # Every row starts with its first value
+    seg_row = [np.arange(n_rows)]
+    seg_start = [np.zeros(n_rows, dtype=int)]
+    seg_stop = [np.ones(n_rows, dtype=int)]
+    seg_order = [np.full(n_rows, -1)]
+
+    for i in range(1, n_values):
+        value = data[:, i]
+        previous = data[:, i - 1]
+
+        # A drop ends, values from before the drop up to this value are added
+        drop_ended = in_drop & ((value >= previous) | (value >= drop_start_value * 0.80))
+        ended = np.flatnonzero(drop_ended)
+        seg_row.append(ended)
+        seg_start.append(drop_end_index[ended])
+        seg_stop.append(np.full(len(ended), i))
+        seg_order.append(np.full(len(ended), i))
+
+        # A drop starts
+        drop_started = ~in_drop & (value < previous)
+        drop_end_index = np.where(drop_started, i - 1, drop_end_index)
+        drop_start_value = np.where(drop_started, previous, drop_start_value)
+        in_drop = (in_drop & ~drop_ended) | drop_started
+
+    # Add the remaining data points after the last drop
+    remaining = np.flatnonzero(drop_end_index < n_values - 1)
+    seg_row.append(remaining)
+    seg_start.append(drop_end_index[remaining] + 1)
+    seg_stop.append(np.full(len(remaining), n_values))
+    seg_order.append(np.full(len(remaining), n_values))
+
+    seg_row = np.concatenate(seg_row)
+    seg_start = np.concatenate(seg_start)
+    seg_stop = np.concatenate(seg_stop)
+    seg_order = np.concatenate(seg_order)
+
+    # Expand the segments, ordered by row and by the moment they were added
+    order = np.lexsort((seg_order, seg_row))
+    seg_row, seg_start, seg_stop = seg_row[order], seg_start[order], seg_stop[order]
+    lengths = seg_stop - seg_start
+    offsets = np.cumsum(lengths) - lengths
+    flat = (np.repeat(seg_start - offsets, lengths) +
+            np.arange(lengths.sum()))
+
+    row_lengths = np.bincount(seg_row, weights=lengths, minlength=n_rows).astype(int)
+
+    return np.split(flat, np.cumsum(row_lengths)[:-1])
+
+
 def remove_continuous_drops_left(data, date):
     """ 
     Remove drops in the left side of the NDVI curve
     
     Args:
-        data (list): list with average NDVI values
-        date (list): list with day in the year values
+        data (list): list with average NDVI values, or 2-D array with an NDVI
+        series of equal length per row
+        date (list): list with day in the year values, per row for 2-D data
+        or shared by all rows
 
     Returns:
-        corrected_date (list): list with day in the year values
-        corrected_data (list): list with average NDVI values
-    """
-    corrected_data = [data[0]]
-    corrected_date = [date[0]] # Start with the first value
-    in_drop = False  # Flag to indicate if we're in a continuous drop
-    drop_start_value = data[0]  # Value at the start of the last detected drop
-
-    for i in range(1, len(data)):
-        if in_drop:
-            # If we're in a drop, check if the current value is less than a 20% drop from the start
-            if data[i] < (drop_start_value * 0.80):
-                corrected_data.append(corrected_data[-1])  # Continue the drop, use the previous corrected value
-                corrected_date.append(corrected_date[-1])  # Continue the drop, use the previous corrected value                
-            else:
-                in_drop = False  # No longer in a drop
-                corrected_data.append(data[i])
-                corrected_date.append(date[i])
-                drop_start_value = data[i]  # Reset the drop start value
-        else:
-            # Calculate the percentage drop from the last non-drop value
-            drop_percentage = (corrected_data[-1] - data[i]) / corrected_data[-1] if corrected_data[-1] != 0 else 0
-            # If there is a drop greater than 20%, we enter a drop state
-            if drop_percentage > 0.2:
-                in_drop = True
-                corrected_data.append(corrected_data[-1])  # Replace the drop
-                corrected_date.append(corrected_date[-1])
-            else:
-                corrected_data.append(data[i])
-                corrected_date.append(date[i])
+        corrected_date (list): list with day in the year values, a list per
+        row for 2-D data
+        corrected_data (list): list with average NDVI values, a list per row
+        for 2-D data
+    """
+    data = np.asarray(data)
+    date = np.broadcast_to(np.asarray(date), data.shape)
+    index = drops_left_index(data)
+
+    if data.ndim == 1:
+        return date[index[0]].tolist(), data[index[0]].tolist()
 
-    return corrected_date, corrected_data
+    return (np.take_along_axis(date, index, axis=1).tolist(),
+            np.take_along_axis(data, index, axis=1).tolist())
 
 
 def remove_continuous_drops_right(data, date):
@@ -150,39 +278,74 @@ def remove_continuous_drops_right(data, date):
     Remove drops in the right side of the NDVI curve
     
     Args:
-        data (list): list with average NDVI values
-        date (list): list with day in the year values
+        data (list): list with average NDVI values, or 2-D array with an NDVI
+        series of equal length per row
+        date (list): list with day in the year values, per row for 2-D data
+        or shared by all rows
 
     Returns:
-        corrected_date (list): list with day in the year values
-        corrected_data (list): list with average NDVI values
-    """
-    corrected_data = [data[0]]
-    corrected_date = [date[0]]  # Start with the first value
-    in_drop = False  # Flag to indicate if we're in a continuous drop
-    drop_end_index = 0  # Index at the end of the last detected drop
-    drop_start_value = data[0]  # Value at the start of the last detected drop
-
-    for i in range(1, len(data)):
-        if in_drop:
-            # If we're in a drop, continue until the drop ends
-            if data[i] >= data[i - 1] or data[i] >= (drop_start_value * 0.80):
-                in_drop = False  # No longer in a drop
-                corrected_data.extend(data[drop_end_index:i])
-                corrected_date.extend(date[drop_end_index:i])
-        else:
-            # Check for a potential drop (if the current value is less than the previous value)
-            if data[i] < data[i - 1]:
-                in_drop = True
-                drop_end_index = i - 1  # Set the drop end index
-                drop_start_value = data[i - 1]  # Set the starting value of the drop
+        corrected_date (list): list with day in the year values, a list per
+        row for 2-D data
+        corrected_data (list): list with average NDVI values, a list per row
+        for 2-D data
+    """
+    data = np.asarray(data)
+    date = np.broadcast_to(np.asarray(date), data.shape)
+    indices = drops_right_index(data)
 
-    # Add the remaining data points after the last drop (if any)
-    if drop_end_index < len(data) - 1:
-        corrected_data.extend(data[drop_end_index + 1:])
-        corrected_date.extend(date[drop_end_index + 1:])
+    if data.ndim == 1:
+        return date[indices[0]].tolist(), data[indices[0]].tolist()
 
-    return corrected_date, corrected_data
+    # Rows keep a different number of values
+    return ([row[index].tolist() for row, index in zip(date, indices)],
+            [row[index].tolist() for row, index in zip(data, indices)])
+
+
+def interpolate_array(doy, values):
+    """
+    Interpolate values for days that are missing, array version of
+    interpolate. Days that occur more than once are all kept, in their order.
+
+    Args:
+        doy (np.array): array with day in the year values
+        values (np.array): array with NDVI values
+
+    Returns:
+        days (np.array): array with every day from the first up to the last day
+        interpolated (np.array): array with NDVI values of days
+    """
+    doy = np.asarray(doy, dtype=float)
+    values = np.asarray(values, dtype=float)
+
+    # Generate a range of days from the minimum to the maximum
+    full_range = np.arange(int(doy.min()), int(doy.max()) + 1)
+
+    # Rows of the input per day, in the order of the input, at least one per day
+    order = np.argsort(doy, kind='stable')
+    first = np.searchsorted(doy[order], full_range, side='left')
+    last = np.searchsorted(doy[order], full_range, side='right')
+    counts = last - first
+    rows = np.maximum(counts, 1)
+
+    days = np.repeat(full_range, rows).astype(float)
+    interpolated = np.full(len(days), np.nan)
+
+    # Fill the positions of days in the input
+    offsets = np.cumsum(rows) - rows
+    present = np.repeat(counts > 0, rows)
+    position = np.arange(len(days)) - np.repeat(offsets, rows)
+    interpolated[present] = values[order][np.repeat(first, rows)[present] +
+                                          position[present]]
+
+    # Linear interpolation of the missing positions, values are equally spaced
+    missing = np.isnan(interpolated)
+    valid = np.flatnonzero(~missing)
+    if len(valid) and missing.any():
+        after_first = missing & (np.arange(len(days)) > valid[0])
+        interpolated[after_first] = np.interp(np.flatnonzero(after_first), valid,
+                                              interpolated[valid])
+
+    return days, interpolated
 
 
 def interpolate(df):
@@ -195,68 +358,112 @@ def interpolate(df):
     Returns:
         merged (pandas.DataFrame): dataframe with interpolated datapoints     
     """
-    # Generate a range of days from the minimum to the maximum
-    full_range = pd.DataFrame({'doy': range(int(df['doy'].min()), int(df['doy'].max()) + 1)})
-    
-    # Merge to include all days in the range
-    merged = pd.merge(df, full_range, on='doy', how='right')
-    
-    # Interpolate the 'average' column
-    merged['average'] = merged['average'].interpolate()
+    days, interpolated = interpolate_array(df['doy'], df['average'])
+    merged = pd.DataFrame({'average': interpolated, 'doy': days})
     
     return merged
 
 
-    
-def main():
-    """ 
-    Main function of this script processing NDVI data
+def growth_cycle(doy, values):
     """
-    
-    # Configure logger
-    logger = configure_logger()
-    
-    # Log the start of the main script
-    logger.info("NDVI processing started.\n")
+    Mask of the crop growth cycle of 160 days around the maximum NDVI value,
+    cut to the last day when the cycle goes up to the end of the year
 
-    # Parse and read file to dataframe
-    args = parse_args()
-    logger.info(f"Using input file: {args.file} \n")
-    df = read_data(args.file, logger)
-    
-    logger.info(f'Datapoints in dataset: {len(df["average"])}')
-    
-    df_filtered = remove_zeros(df)
-    
-    maxavg = int(df_filtered['average'].idxmax())
+    Args:
+        doy (np.array): array with day in the year values
+        values (np.array): array with NDVI values
 
-    # Cut dataframe to crop growth cycle of 160 days
-    start = df_filtered.iloc[maxavg]['doy']-75
-    end = df_filtered.iloc[maxavg]['doy']+85
+    Returns:
+        (np.array): boolean array, True for days in the growth cycle
+    """
+    peak = np.argmax(values)
+    start = doy[peak]-75
+    end = doy[peak]+85
 
-    # If growth cycle goes up to end of the year, cut the dataframe to the end of the year
+    # If growth cycle goes up to end of the year, cut to the end of the year
     if end > 365:
-        end = max(df_filtered['doy'])
-    
-    df = df_filtered[(df_filtered['doy'] >= start) & (df_filtered['doy'] <= end)]
-    
-    df = df.reset_index()
-    df = df.drop('index', axis=1)
-    
-    # Split dataframe in a left and right side of the curve, with average as breakpoint
-    maxavg = int(df['average'].idxmax())
-    left = df.iloc[:maxavg+1]
-    right = df.iloc[maxavg:]
-    
-    right = right.reset_index()
-    
-    # Removing drops from both sides of the curve
-    doy_l, datal = remove_continuous_drops_left(left['average'], left['doy'])
-    doy_r, datar = remove_continuous_drops_right(right['average'], right['doy'])
-    
+        end = max(doy)
+
+    return (doy >= start) & (doy <= end)
+
+
+def process_series(doy, values):
+    """
+    Clean one NDVI series: remove values below 0.1, cut the series to the crop
+    growth cycle, remove drops on both sides of the maximum and smooth both sides
+
+    Args:
+        doy (np.array): array with day in the year values
+        values (np.array): array with NDVI values
+
+    Returns:
+        window (tuple): day in the year and NDVI arrays of the growth cycle
+        left (tuple): day in the year and smoothed NDVI arrays up to the maximum
+        right (tuple): day in the year and smoothed NDVI arrays from the maximum
+    """
+    doy = np.asarray(doy, dtype=float)
+    values = np.asarray(values, dtype=float)
+
+    # Remove values below 0.1
+    mask = nonzero_mask(values)
+    doy, values = doy[mask], values[mask]
+
+    # Cut series to crop growth cycle of 160 days
+    mask = growth_cycle(doy, values)
+    doy, values = doy[mask], values[mask]
+
+    # Split series in a left and right side of the curve, with maximum as breakpoint
+    peak = np.argmax(values)
+    doy_l, datal = remove_continuous_drops_left(values[:peak+1], doy[:peak+1])
+    doy_r, datar = remove_continuous_drops_right(values[peak:], doy[peak:])
+
     # Smooth left and right side curves
     smleft = savgol_filter(datal, window_length=3, polyorder=1)
     smright = savgol_filter(datar, window_length=3, polyorder=1)
+
+    return (doy, values), (np.array(doy_l), smleft), (np.array(doy_r), smright)
+
+
+def plot_curve(df, merge, file):
+    """
+    Plot the NDVI values of the growth cycle and the processed curve
+
+    Args:
+        df (pandas.DataFrame): dataframe with 'doy' and 'average' NDVI values
+        merge (pandas.DataFrame): dataframe with the processed NDVI curve
+        file (str): filepath of the image
+    """
+    # Only import matplotlib when figures are requested
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    plt.figure()
+    plt.plot(df['doy'], df['average'], color='#00FF00', linewidth=0.5)
+    plt.plot(merge['doy'], merge['average'])
+    plt.ylabel('NDVI')
+    plt.xlabel('Day in year')
+    plt.title('NDVI')
+    plt.yticks([0,0.1,0.2,0.3,0.4,0.5,0.6,0.7,0.8,0.9,1])
+    plt.savefig(file)
+    plt.close()
+
+
+def process_file(file, result, logger, plot=False):
+    """
+    Process the NDVI data of one file and save the result
+
+    Args:
+        file (str): filepath of input file
+        result (str): filepath of result file
+        plot (bool): save a figure of the curve in result.png
+    """
+    df = read_data(file, logger)
+    
+    logger.info(f'Datapoints in dataset: {len(df["average"])}')
+    
+    window, (doy_l, smleft), (doy_r, smright) = process_series(df['doy'], df['average'])
+    df = pd.DataFrame({'average': window[1], 'doy': window[0]})
     
     # Create new dataframes
     left = pd.DataFrame({'average': smleft, 'doy': doy_l})
@@ -275,22 +482,113 @@ def main():
     
     logger.info(f'shape of dataframe: {merge.shape} \n')
     
-    # Save to file in csv format
-    merge.to_csv(args.result, index=False)
+    # Save to file in the format of its extension
+    table_io.write_table(merge, result)
     
-    logger.info(f'Dataframe saved in: {args.result}')
+    logger.info(f'Dataframe saved in: {result}')
     
     # Plot figure
-    plt.figure()
-    plt.plot(df['doy'], df['average'], color='#00FF00', linewidth=0.5)
-    plt.plot(merge['doy'], merge['average'])
-    plt.ylabel('NDVI')
-    plt.xlabel('Day in year')
-    plt.title('NDVI')
-    plt.yticks([0,0.1,0.2,0.3,0.4,0.5,0.6,0.7,0.8,0.9,1])
-    plt.savefig(args.result + '.png')
+    if plot:
+        plot_curve(df, merge, result + '.png')
+        logger.info(f'Created image saved in: {result}.png \n')
+
+
+class ListHandler(logging.Handler):
+    """
+    Logging handler keeping the level and message of each record in a list
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((record.levelno, record.getMessage()))
+
+
+def process_batch_file(file, result, plot=False):
+    """
+    Process one file of a batch in a worker process, collecting the log
+    messages so the main process can write them to one log file
+
+    Args:
+        file (str): filepath of input file
+        result (str): filepath of result file
+        plot (bool): save a figure of the curve in result.png
+
+    Returns:
+        records (list): list with (level, message) of each log record
+    """
+    logger = logging.getLogger(f"{__name__}.batch")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    handler = ListHandler()
+    logger.addHandler(handler)
+
+    try:
+        process_file(file, result, logger, plot)
+    except (Exception, SystemExit) as e:
+        logger.error(f"Processing failed: {e!r}")
+    finally:
+        logger.removeHandler(handler)
+
+    return handler.records
+
+
+def find_files(pattern):
+    """
+    Find the CSV, Parquet and Feather files of a directory or glob pattern
+
+    Args:
+        pattern (str): directory or glob pattern
+
+    Returns:
+        (list): sorted list with filepaths
+    """
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*')
+
+    return sorted(file for file in glob.glob(pattern) if table_io.is_supported(file))
+
+
+def main():
+    """ 
+    Main function of this script processing NDVI data
+    """
     
-    logger.info(f'Created image saved in: {args.result}.png \n')
+    # Configure logger
+    logger = configure_logger()
+    
+    # Log the start of the main script
+    logger.info("NDVI processing started.\n")
+
+    # Parse arguments
+    args = parse_args()
+
+    if os.path.isfile(args.file):
+        logger.info(f"Using input file: {args.file} \n")
+        process_file(args.file, args.result, logger, args.plot)
+
+    else:
+        files = find_files(args.file)
+        if not files:
+            logger.info(f"No input files found: {args.file} \n")
+            sys.exit(1)
+
+        logger.info(f"Using {len(files)} input files: {args.file} \n")
+        os.makedirs(args.result, exist_ok=True)
+        results = [os.path.join(args.result, os.path.basename(file)) for file in files]
+
+        if args.workers > 1 and len(files) > 1:
+            with ProcessPoolExecutor(max_workers=args.workers) as executor:
+                batch = executor.map(process_batch_file, files, results, repeat(args.plot))
+                for file, records in zip(files, batch):
+                    for level, message in records:
+                        logger.log(level, f"{file}: {message}")
+        else:
+            for file, result in zip(files, results):
+                for level, message in process_batch_file(file, result, args.plot):
+                    logger.log(level, f"{file}: {message}")
     
     logger.info("NDVI processing completed.")
     
@@ -298,7 +596,6 @@ def main():
     logging.shutdown()
     
     return 0
-
     
 if __name__ == "__main__":
     try:
@@ -10,17 +10,26 @@ Version: 1.1
 """
 
 # Import necessary modules
+import os
 import sys
 import argparse
 import logging
+from itertools import chain, repeat
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 
 # Import additional scripts
 import ET0calculation
+import radiation_table
+import table_io
 from NDVI_Data import Kc_curve
 import ETcCalculation
 
 
+# Constants
+LOGGER_NAME = 'main'
+
+
 # Functions
 def parse_args():
     """
@@ -31,11 +40,31 @@ def parse_args():
     """
     parser = argparse.ArgumentParser()
     parser.add_argument("-f", "--file",
-                        help="""The location and name to meteorological data in CSV format""",
+                        help="""The location and name to meteorological data in CSV,
+                        Parquet (.parquet) or Feather (.feather) format""",
                         required=True)
     parser.add_argument("-r", "--result",
-                        help="""The location and name result file in CSV format""",
+                        help="""The location and name result file in CSV, Parquet
+                        (.parquet) or Feather (.feather) format""",
                         required=True)
+    parser.add_argument("--radiation-cache",
+                        help="""Directory to store the extraterrestrial radiation
+                        tables between runs""")
+    parser.add_argument("--stream", action="store_true",
+                        help="""Read the input file in chunks of complete fields and
+                        write the result incrementally, the input file must be
+                        ordered by field""")
+    parser.add_argument("--chunksize", type=int, default=100000,
+                        help="""Number of rows read per chunk in stream mode""")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                        help="""Number of processes calculating fields in parallel""")
+    parser.add_argument("-b", "--breakpoints", choices=Kc_curve.ENGINES, default='dp',
+                        help="""Engine to find the breakpoints of the Kc curve,
+                        deterministic dynamic programming (dp) or pwlf""")
+    parser.add_argument("--kc-cache",
+                        help="""Directory to store fitted Kc curves between runs""")
+    parser.add_argument("--kc-cache-size", type=int, default=Kc_curve.CACHE_SIZE,
+                        help="""Maximum number of Kc curves kept in the cache""")
     return parser.parse_args()
 
 
@@ -47,7 +76,7 @@ def configure_logger():
         logger (logging.Logger): The configured logger instance.
     """
     # Create a logger
-    logger = logging.getLogger(__name__)
+    logger = logging.getLogger(LOGGER_NAME)
     logger.setLevel(logging.DEBUG)
 
     # Create a file handler
@@ -68,7 +97,7 @@ def configure_logger():
         logger.addHandler(file_handler)
     else:
         # If the logger is already configured, get the existing logger
-        logger = logging.getLogger(__name__)
+        logger = logging.getLogger(LOGGER_NAME)
     logger.propagate = False
 
     return logger
@@ -87,7 +116,7 @@ def read_data(file, logger):
     """
 
     try:
-        df = pd.read_csv(file)
+        df = table_io.read_table(file)
 
     except FileNotFoundError:
         logger.info(f"File '{file}' not found. \n")
@@ -97,6 +126,180 @@ def read_data(file, logger):
     return df
 
 
+def field_columns(df):
+    """
+    Columns identifying the field of each row, the 'field' column when
+    available, otherwise the location
+
+    Args:
+        df (pandas.Dataframe): dataframe with meteorological information
+
+    Returns:
+        (list): list with column names
+    """
+    if 'field' in df.columns:
+        return ['field']
+
+    return ['lat', 'lon']
+
+
+def split_fields(df):
+    """
+    Partition dataframe by field, in order of first appearance in the input
+
+    Args:
+        df (pandas.Dataframe): dataframe with meteorological information
+
+    Returns:
+        (list): list with a dataframe per field
+    """
+    return [field_df for _, field_df in
+            df.groupby(field_columns(df), sort=False, dropna=False)]
+
+
+def init_worker(radiation_cache):
+    """
+    Initialize a worker process with the logger and radiation table of the
+    main process
+
+    Args:
+        radiation_cache (str): directory of the radiation table cache or None
+    """
+    configure_logger()
+    if radiation_cache:
+        radiation_table.configure(cache_dir=radiation_cache)
+
+
+def process_field(df, logger, engine='dp', cache=None):
+    """
+    Calculate ET0, the Kc curve and ETc for the data of one field
+
+    Args:
+        df (pandas.Dataframe): dataframe with meteorological information
+        and NDVI of one field
+        engine (str): breakpoint engine of the Kc curve
+        cache (Kc_curve.KcCache): cache of Kc curves or None
+
+    Returns:
+        df_ETc (pandas.Dataframe): dataframe with addition of ET0, Kc and ETc
+    """
+    # ET0 calculation from weather data
+    df = ET0calculation.main(df, logger)
+
+    # Kc curve calculations from NDVI data
+    df_Kc = Kc_curve.main(df, logger, engine, cache)
+
+    # ETc calculation
+    df_ETc = ETcCalculation.main(df_Kc, logger)
+
+    return df_ETc
+
+
+def process_fields(fields, logger, executor=None, engine='dp', cache=None):
+    """
+    Calculate all fields, in parallel when an executor is given
+
+    Args:
+        fields (list): list with a dataframe per field
+        executor (ProcessPoolExecutor): pool of worker processes or None
+        engine (str): breakpoint engine of the Kc curve
+        cache (Kc_curve.KcCache): cache of Kc curves or None
+
+    Returns:
+        (list): list with the result per field, in the order of fields
+    """
+    if executor is None or len(fields) < 2:
+        return [process_field(df, logger, engine, cache) for df in fields]
+
+    return list(executor.map(process_field, fields, repeat(logger), repeat(engine),
+                             repeat(cache)))
+
+
+def read_chunks(file, chunksize, logger):
+    """
+    Read file in chunks, only yielding complete fields. Rows of the last field
+    in a chunk are held back until the next chunk, so a season of a field is
+    never split over two chunks.
+
+    Args:
+        file (str): filepath of input file, ordered by field
+        chunksize (int): number of rows read per chunk
+
+    Yields:
+        df (pandas.Dataframe): dataframe with all rows of one or more fields
+    """
+    try:
+        reader = table_io.read_chunks(file, chunksize)
+
+    except FileNotFoundError:
+        logger.info(f"File '{file}' not found. \n")
+        return
+    except IOError as e:
+        logger.info(f"An error occurred while reading the file: {e} \n")
+        return
+
+    carry = None
+    for chunk in reader:
+        if chunk.empty:
+            continue
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+
+        keys = chunk[field_columns(chunk)]
+        last_field = (keys == keys.iloc[-1]).all(axis=1)
+
+        carry = chunk[last_field]
+        if not last_field.all():
+            yield chunk[~last_field]
+
+    if carry is not None and len(carry):
+        yield carry
+
+
+def stream(file, result, chunksize, logger, executor=None, engine='dp', cache=None):
+    """
+    Calculate ETc chunk by chunk, writing the result of the fields in a chunk
+    to the result file as soon as they are calculated
+
+    Args:
+        file (str): filepath of input file, ordered by field
+        result (str): filepath of result file
+        chunksize (int): number of rows read per chunk
+        executor (ProcessPoolExecutor): pool of worker processes or None
+        engine (str): breakpoint engine of the Kc curve
+        cache (Kc_curve.KcCache): cache of Kc curves or None
+
+    Returns:
+        rows (int): number of rows written to the result file, 0 without
+        fields and then no result file is written
+    """
+    rows = 0
+    finished = set()
+
+    # The result file is only created when there are fields
+    chunks = read_chunks(file, chunksize, logger)
+    first = next(chunks, None)
+    if first is None:
+        return rows
+
+    with table_io.TableWriter(result) as output:
+        for chunk in chain([first], chunks):
+            fields = split_fields(chunk)
+
+            for field_df in fields:
+                key = tuple(field_df[field_columns(field_df)].iloc[0])
+                if key in finished:
+                    logger.warning(f"Field {key} is not contiguous in the input file, "
+                                   "its season is split \n")
+                finished.add(key)
+
+            for df_ETc in process_fields(fields, logger, executor, engine, cache):
+                output.write(df_ETc)
+                rows += len(df_ETc)
+
+    return rows
+
+
 def main():
     """
     Main function of the program, calling the scripts ET0calculation.py,
@@ -109,23 +312,60 @@ def main():
     # Log the start of the main script
     logger.info("Main script started.\n")
 
-    # Parse and read file to dataframe
     args = parse_args()
     logger.info(f"Using input file: {args.file} \n")
-    df = read_data(args.file, logger)
 
-    # ET0 calculation from weather data
-    df = ET0calculation.main(df.copy(), logger)
+    if args.radiation_cache:
+        radiation_table.configure(cache_dir=args.radiation_cache)
 
-    # Kc curve calculations from NDVI data
-    df_Kc = Kc_curve.main(df.copy(), logger)
+    # Cache of fitted Kc curves
+    cache = None
+    if args.kc_cache:
+        cache = Kc_curve.KcCache(args.kc_cache, args.kc_cache_size)
 
-    # ETc calculation
-    df_ETc = ETcCalculation.main(df_Kc.copy(), logger)
+    # Worker processes calculating fields in parallel
+    executor = None
+    if args.workers > 1:
+        executor = ProcessPoolExecutor(max_workers=args.workers,
+                                       initializer=init_worker,
+                                       initargs=(args.radiation_cache,))
+        logger.info(f"Using {args.workers} worker processes \n")
 
-    # Save to CSV file
-    df_ETc.to_csv(args.result, index=False)
-    logger.info(f"Result saved in {args.result} \n" )
+    try:
+        if args.stream:
+            # Calculate and save chunks of complete fields
+            rows = stream(args.file, args.result, args.chunksize, logger,
+                          executor, args.breakpoints, cache)
+            if rows:
+                logger.info(f"Result of {rows} rows saved in {args.result} \n")
+
+        else:
+            # Read file to dataframe and split per field
+            df = read_data(args.file, logger)
+            fields = split_fields(df)
+            logger.info(f"Number of fields in input file: {len(fields)} \n")
+
+            rows = 0
+            if fields:
+                # ET0, Kc and ETc calculation per field
+                df_ETc = pd.concat(process_fields(fields, logger, executor,
+                                                  args.breakpoints, cache),
+                                   ignore_index=True)
+
+                # Save to result file
+                table_io.write_table(df_ETc, args.result)
+                rows = len(df_ETc)
+                logger.info(f"Result saved in {args.result} \n" )
+
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    # Input file with a header and no rows
+    if rows == 0:
+        logger.info(f"No fields in input file {args.file} \n")
+        print(f"Error: No fields in input file {args.file}.")
+        sys.exit(1)
 
     # Log the end of the main script
     logger.info("Main script finished.")
@@ -11,85 +11,645 @@ Version:1
 
 import sys
 import os
+import json
+import time
+import hashlib
+import logging
 import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import xgboost as xgb
 import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error
 
+import table_io
+
+# Constants
+FEATURES = ['date', 'field', 'Tmin', 'Tmax', 'Tmean', 'RHmin', 'RHmax', 'uz', 'n',
+            'day_of_year', 'ET0']
+TARGET = 'ETc'
+PARAMS = {'objective': 'reg:squarederror', 'seed': 42}
+LARGE_PARAMS = {'objective': 'reg:squarederror', 'seed': 42, 'tree_method': 'hist',
+                'max_bin': 256, 'rounds': 1000, 'early_stopping': 50}
+SPLIT = {'test_size': 0.2, 'random_state': 42}
+MODEL_DIR = 'models'
+CHUNKSIZE = 100000
+GRID = {'max_depth': [3, 6, 9],
+        'learning_rate': [0.05, 0.1, 0.3],
+        'n_estimators': [100, 300],
+        'subsample': [0.8, 1.0],
+        'min_child_weight': [1, 5]}
+FOLDS = 3
+FIELD_GROUPS = 3
+TREES = 50
+
+# Training data of a tuning worker process
+tuning_data = None
+
 
 def is_csv_file(filename):
     """
-    check if argument files are in CSV format
+    check if argument files are in CSV, Parquet or Feather format
 
     Args:
         filename (str): path of file
 
     Returns:
-        file_extension.lower() == '.csv' (bool): boolean to confirm format
+        (bool): boolean to confirm format
+    """
+    return table_io.is_supported(filename)
+
+
+def configure_logger():
+    """
+    Create logger to store information with a specified log file
+
+    Returns:
+        logger (logging.Logger): The configured logger instance.
     """
-    _, file_extension = os.path.splitext(filename)
+    # Create a logger
+    logger = logging.getLogger('model')
+    logger.setLevel(logging.DEBUG)
 
-    return file_extension.lower() == '.csv'
+    # Check if handlers already exist to avoid duplication
+    if not logger.handlers:
+        # Create a file handler
+        file_handler = logging.FileHandler('model_log.log')
+        file_handler.setLevel(logging.DEBUG)
+
+        # Create a formatter and set the formatter for the handler
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        file_handler.setFormatter(formatter)
+
+        # Add the handler to the logger
+        logger.addHandler(file_handler)
+
+    return logger
 
 
 def parse_args():
     """
-    parse command-line arguments for input and output files
+    parse command-line arguments for input and output files. Without a
+    command, the model is trained when no saved model of the training data
+    exists and used to predict.
 
     Returns:
-        parser.parse_args()
+        args (argparse.Namespace): parsed arguments
     """
     parser = argparse.ArgumentParser()
     parser.add_argument("-t", "--train",
                         help="""The path and filename of input data
-                        to train model in CSV format""",
-                        required=True)
+                        to train model in CSV, Parquet or Feather format""")
     parser.add_argument("-p", "--predict",
                         help="""The path and filename of input data
-                        to predict in CSV format""",
-                        required=True)
+                        to predict in CSV, Parquet or Feather format""")
     parser.add_argument("-r", "--result",
                         help="""The path and filename of result file
-                        in CSV format""",
-                        required=True)
+                        in CSV, Parquet or Feather format""")
+    parser.add_argument("--models", default=MODEL_DIR,
+                        help="""Directory of the saved models""")
+    parser.add_argument("--stream", action="store_true",
+                        help="""Predict in chunks and append them to the result file,
+                        the result only has the model columns, ETc and datex""")
+    add_training_args(parser)
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE,
+                        help="""Number of rows predicted per chunk in stream mode""")
+
+    commands = parser.add_subparsers(dest="command")
+
+    train_parser = commands.add_parser("train", help="""Train and save a model""")
+    train_parser.add_argument("-t", "--train", required=True,
+                              help="""The path and filename of input data
+                              to train model""")
+    train_parser.add_argument("--models", default=MODEL_DIR,
+                              help="""Directory of the saved models""")
+    train_parser.add_argument("--force", action="store_true",
+                              help="""Train again when a saved model exists""")
+    add_training_args(train_parser)
+
+    predict_parser = commands.add_parser("predict", help="""Predict with a saved model""")
+    predict_parser.add_argument("-m", "--model",
+                                help="""The path and filename of a saved model""")
+    predict_parser.add_argument("-t", "--train",
+                                help="""The path and filename of the training data
+                                of the saved model, instead of --model""")
+    predict_parser.add_argument("-p", "--predict", required=True,
+                                help="""The path and filename of input data
+                                to predict""")
+    predict_parser.add_argument("-r", "--result", required=True,
+                                help="""The path and filename of result file""")
+    predict_parser.add_argument("--models", default=MODEL_DIR,
+                                help="""Directory of the saved models""")
+    predict_parser.add_argument("--stream", action="store_true",
+                                help="""Predict in chunks and append them to the result
+                                file, the result only has the model columns, ETc and
+                                datex""")
+    predict_parser.add_argument("--chunksize", type=int, default=CHUNKSIZE,
+                                help="""Number of rows predicted per chunk in stream mode""")
+    add_training_args(predict_parser)
+
+    update_parser = commands.add_parser("update", help="""Continue boosting a saved model
+                                        on new rows""")
+    update_parser.add_argument("-m", "--model", required=True,
+                               help="""Saved model (.json) to continue from""")
+    update_parser.add_argument("-t", "--train", required=True,
+                               help="""The path and filename of the new rows to
+                               train on""")
+    update_parser.add_argument("--trees", type=int, default=TREES,
+                               help="""Maximum number of trees added to the model""")
+    update_parser.add_argument("--models", default=MODEL_DIR,
+                               help="""Directory of the saved models""")
+    update_parser.add_argument("--force", action="store_true",
+                               help="""Update again when the updated model exists""")
+
+    tune_parser = commands.add_parser("tune", help="""Search hyperparameters with field and
+                                      time blocked cross-validation and save the best model""")
+    tune_parser.add_argument("-t", "--train", required=True,
+                             help="""The path and filename of input data
+                             to train model""")
+    tune_parser.add_argument("--models", default=MODEL_DIR,
+                             help="""Directory of the saved models""")
+    tune_parser.add_argument("--search", choices=['grid', 'random'], default='grid',
+                             help="""Try every combination of the parameter grid, or a
+                             random sample of it""")
+    tune_parser.add_argument("--candidates", type=int, default=10,
+                             help="""Number of candidates of a random search""")
+    tune_parser.add_argument("--seed", type=int, default=42,
+                             help="""Seed of the random search""")
+    tune_parser.add_argument("--folds", type=int, default=FOLDS,
+                             help="""Number of time blocks to validate on, every fold
+                             trains on the days before its block""")
+    tune_parser.add_argument("--field-groups", type=int, default=FIELD_GROUPS,
+                             help="""Number of groups of fields, every fold validates on
+                             fields it did not train on""")
+    tune_parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                             help="""Number of processes training folds in parallel""")
 
     args = parser.parse_args()
 
-    if not is_csv_file(args.train) or not is_csv_file(args.predict):
-        print("Error: One or more input files are not in CSV format.")
+    if args.command is None and None in (args.train, args.predict, args.result):
+        parser.error("the following arguments are required: -t/--train, -p/--predict, "
+                     "-r/--result, or use the train or predict command")
+
+    if args.command == "predict" and args.model is None and args.train is None:
+        parser.error("predict requires -m/--model or -t/--train")
+
+    if args.command == "update" and args.trees < 1:
+        parser.error("--trees must be at least 1")
+
+    files = [file for file in (args.train, args.predict) if file is not None]
+    if not all(is_csv_file(file) for file in files):
+        print("Error: One or more input files are not in CSV, Parquet or Feather format.")
         sys.exit(1)
 
     return args
 
 
-def xgboost_train(X,y):
+def add_training_args(parser):
+    """
+    Add the arguments of the large-data training mode to a parser, the
+    predict command uses them to find the saved model of the training data
+
+    Args:
+        parser (argparse.ArgumentParser): parser of a command
+    """
+    parser.add_argument("--large", action="store_true",
+                        help="""Train on a quantized QuantileDMatrix with the histogram
+                        tree method on all cores, with early stopping on the holdout set""")
+    parser.add_argument("--rounds", type=int, default=LARGE_PARAMS['rounds'],
+                        help="""Maximum number of boosting rounds in large mode""")
+    parser.add_argument("--early-stopping", type=int,
+                        default=LARGE_PARAMS['early_stopping'],
+                        help="""Stop when the holdout RMSE did not improve for this number
+                        of rounds in large mode, 0 to train all rounds""")
+
+
+def training_params(args):
+    """
+    Parameters of the model to train
+
+    Args:
+        args (argparse.Namespace): parsed arguments
+
+    Returns:
+        params (dict): parameters of the model
+    """
+    if not args.large:
+        return PARAMS
+
+    return dict(LARGE_PARAMS, rounds=args.rounds, early_stopping=args.early_stopping)
+
+
+def model_key(data, params=PARAMS):
+    """
+    Create the key of a model from the training data and parameters, the
+    same data and parameters give the same key
+
+    Args:
+        data (pandas.Dataframe): dataframe with features and target
+        params (dict): parameters of the model
+
+    Returns:
+        (str): hexadecimal sha256 hash
+    """
+    # Same values give the same key, whatever the file format stored them as
+    widen = {column: 'int64' for column in data.select_dtypes('integer').columns}
+    widen.update({column: 'float64' for column in data.select_dtypes('floating').columns})
+    data = data.astype(widen)
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps({'params': params, 'split': SPLIT,
+                              'columns': list(data.columns),
+                              'dtypes': [str(dtype) for dtype in data.dtypes],
+                              'xgboost': xgb.__version__},
+                             sort_keys=True).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+
+    return digest.hexdigest()
+
+
+def model_path(directory, key):
+    """
+    Path of the saved model of a key
+
+    Args:
+        directory (str): directory of the saved models
+        key (str): key of the model
+
+    Returns:
+        (str): path of the booster file, the feature schema is saved next to
+        it with extension .schema.json
+    """
+    return os.path.join(directory, f"{key}.json")
+
+
+def schema_path(path):
+    """
+    Path of the feature schema of a saved model
+
+    Args:
+        path (str): path of the booster file
+
+    Returns:
+        (str): path of the schema file
+    """
+    return os.path.splitext(path)[0] + '.schema.json'
+
+
+def save_model(xg_reg, schema, path):
+    """
+    Save the booster and the feature schema of a trained model
+
+    Args:
+        xg_reg (XGBRegressor): trained model
+        schema (dict): features, their types and the training parameters
+        path (str): path of the booster file
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    # Write to temporary files first, so a model is never saved half
+    tmp_model = path + '.tmp.json'
+    tmp_schema = schema_path(path) + '.tmp'
+    xg_reg.save_model(tmp_model)
+    with open(tmp_schema, 'w') as file:
+        json.dump(schema, file, indent=2)
+
+    os.replace(tmp_schema, schema_path(path))
+    os.replace(tmp_model, path)
+
+
+def load_model(path):
+    """
+    Load a saved model and its feature schema
+
+    Args:
+        path (str): path of the booster file
+
+    Returns:
+        xg_reg (XGBRegressor): trained model
+        schema (dict): features, their types and the training parameters
+    """
+    xg_reg = xgb.XGBRegressor()
+    xg_reg.load_model(path)
+
+    with open(schema_path(path)) as file:
+        schema = json.load(file)
+
+    return xg_reg, schema
+
+
+def train(file, directory, force=False, params=PARAMS, logger=None):
+    """
+    Train a model on the data of a file and save it, unless a model of the
+    same data and parameters is saved already
+
+    Args:
+        file (str): path of the training data
+        directory (str): directory of the saved models
+        force (bool): train again when a saved model exists
+        params (dict): parameters of the model
+        logger (logging.Logger): logger of the training results or None
+
+    Returns:
+        path (str): path of the saved model
+    """
+    data = table_io.read_table(file, columns=FEATURES + [TARGET])
+    data = data[FEATURES + [TARGET]]
+    path = model_path(directory, model_key(data, params))
+
+    if os.path.exists(path) and not force:
+        print(f"Using saved model: {path}")
+        return path
+
+    # Train XGBoost algorithm on data
+    xg_reg = xgboost_train(data[FEATURES], data[TARGET], params, logger)
+
+    schema = {'features': FEATURES,
+              'dtypes': {feature: str(data[feature].dtype) for feature in FEATURES},
+              'target': TARGET,
+              'params': params,
+              'split': SPLIT,
+              'training_file': os.path.abspath(file),
+              'rows': len(data),
+              'windows': [data_window(data, file, xg_reg)]}
+    save_model(xg_reg, schema, path)
+    print(f"Model saved in: {path}")
+
+    return path
+
+
+def data_window(data, file, xg_reg):
+    """
+    Describe the rows a model version was trained on
+
+    Args:
+        data (pandas.Dataframe): dataframe with features and target
+        file (str): path of the data
+        xg_reg (XGBRegressor): model after training on the rows
+
+    Returns:
+        (dict): file, key of the rows, number of rows, first and last date
+        and the number of trees the model predicts with after training on them
+    """
+    dates = pd.to_datetime(data['date'], unit='s')
+
+    # Trees after the best round are not used to predict
+    booster = xg_reg.get_booster()
+    trees = booster.num_boosted_rounds()
+    if 'best_iteration' in booster.attributes():
+        trees = booster.best_iteration + 1
+
+    return {'file': os.path.abspath(file),
+            'key': model_key(data, {}),
+            'rows': len(data),
+            'first_date': dates.min().date().isoformat(),
+            'last_date': dates.max().date().isoformat(),
+            'trees': trees}
+
+
+def update(path, file, directory, trees=TREES, force=False, logger=None):
+    """
+    Continue boosting a saved model on new rows only, adding at most a number
+    of trees. The updated model is saved as a new version, with the data
+    windows of all versions before it in its schema.
+
+    Args:
+        path (str): path of the saved model to continue from
+        file (str): path of the new rows
+        directory (str): directory of the saved models
+        trees (int): maximum number of trees to add
+        force (bool): update again when the updated model exists
+        logger (logging.Logger): logger of the update results or None
+
+    Returns:
+        path (str): path of the updated model
+    """
+    xg_reg, schema = load_model(path)
+
+    data = table_io.read_table(file, columns=schema['features'] + [schema['target']])
+    data = data[schema['features'] + [schema['target']]]
+    data = data.astype(schema['dtypes'])
+    if data.empty:
+        print(f"Error: No rows to update the model with in {file}.")
+        sys.exit(1)
+
+    # Models saved before windows were recorded only know their training file
+    windows = schema.get('windows', [{'file': schema.get('training_file'),
+                                      'rows': schema.get('rows')}])
+    window_key = model_key(data, {})
+    if any(window.get('key') == window_key for window in windows):
+        print(f"Error: The model has already been trained on the rows of {file}.")
+        sys.exit(1)
+
+    parent = os.path.splitext(os.path.basename(path))[0]
+    new_path = model_path(directory, model_key(data, {'parent': parent, 'trees': trees}))
+    if os.path.exists(new_path) and not force:
+        print(f"Using saved model: {new_path}")
+        return new_path
+
+    X = data[schema['features']]
+    y = data[schema['target']]
+    booster = xg_reg.get_booster()
+
+    # Continue after the best round, the trees after it are not used to predict
+    if 'best_iteration' in booster.attributes():
+        booster = booster[:booster.best_iteration + 1]
+
+    # Error of the saved model on rows it has not seen
+    rmse_before = np.sqrt(mean_squared_error(y, booster.inplace_predict(X)))
+
+    start = time.perf_counter()
+    params = {key: value for key, value in schema['params'].items()
+              if key not in ('rounds', 'early_stopping', 'n_estimators')}
+    if params.get('tree_method') == 'hist':
+        params['n_jobs'] = os.cpu_count()
+    xg_reg = xgb.XGBRegressor(**params, n_estimators=trees)
+    xg_reg.fit(X, y, xgb_model=booster)
+    seconds = time.perf_counter() - start
+
+    rmse_after = np.sqrt(mean_squared_error(y, xg_reg.predict(X)))
+    message = (f"Updated on {len(data)} rows in {seconds:.1f} s with {trees} trees, "
+               f"RMSE on the new rows {rmse_before:.4f} before, {rmse_after:.4f} after")
+    print(message)
+    if logger is not None:
+        logger.info(f"{message} \n")
+
+    schema = dict(schema, parent=parent, rows=len(data),
+                  training_file=os.path.abspath(file),
+                  windows=windows + [data_window(data, file, xg_reg)])
+    save_model(xg_reg, schema, new_path)
+    print(f"Model saved in: {new_path}")
+
+    return new_path
+
+
+def predict(path, file, result):
+    """
+    Predict ETc of the data of a file with a saved model and save the result
+
+    Args:
+        path (str): path of the saved model
+        file (str): path of the data to predict
+        result (str): path of the result file
+    """
+    xg_reg, schema = load_model(path)
+
+    new_data = table_io.read_table(file)
+
+    missing = [feature for feature in schema['features'] if feature not in new_data.columns]
+    if missing:
+        print(f"Error: Columns missing in {file}: {', '.join(missing)}")
+        sys.exit(1)
+
+    # Make ETc predictions on new data, with the types of the training data
+    X_new = new_data[schema['features']].astype(schema['dtypes'])
+    predictions = xgboost_test(xg_reg, X_new)
+
+    # Add predicted ETc to dataframe
+    new_data[schema['target']] = predictions
+
+    new_data['datex'] = pd.to_datetime(new_data['date']+86400,
+                                       origin='1970-01-01', unit='s', utc=False)
+
+    # Save data to result file
+    table_io.write_table(new_data, result)
+
+
+def predict_stream(path, file, result, chunksize=CHUNKSIZE):
+    """
+    Predict ETc of the data of a file with a saved model in chunks. Only the
+    model columns are read, with the types of the training data, and each
+    predicted chunk is appended to the result file, so memory use does not
+    depend on the size of the file.
+
+    Args:
+        path (str): path of the saved model
+        file (str): path of the data to predict
+        result (str): path of the result file
+        chunksize (int): number of rows per chunk
+
+    Returns:
+        rows (int): number of predicted rows
+    """
+    xg_reg, schema = load_model(path)
+
+    start = time.perf_counter()
+    rows = 0
+
+    try:
+        reader = table_io.read_chunks(file, chunksize, columns=schema['features'],
+                                      dtype=schema['dtypes'])
+    except ValueError as e:
+        # Columns missing in file
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    # Chunks have the types of the training data
+    with table_io.TableWriter(result, widen=False) as output:
+        for chunk in reader:
+            X_new = chunk[schema['features']]
+            chunk[schema['target']] = xgboost_test(xg_reg, X_new)
+            chunk['datex'] = pd.to_datetime(chunk['date']+86400,
+                                            origin='1970-01-01', unit='s', utc=False)
+
+            output.write(chunk)
+            rows += len(chunk)
+
+    seconds = time.perf_counter() - start
+    print(f"Predicted {rows} rows in {seconds:.1f} s "
+          f"({rows / seconds if seconds else 0:.0f} rows/s)")
+
+    return rows
+
+
+def xgboost_train(X, y, params=PARAMS, logger=None):
     """
     Training XGBoost algorithm
 
     Args:
         X (pandas.Dataframe): dataframe with information regarding evapotranspiration
         y (pandas.series): series with evapotranspiration values
+        params (dict): parameters of the model, LARGE_PARAMS for the
+        large-data training mode
+        logger (logging.Logger): logger of the RMSE and training time or None
 
     Returns:
         xg_reg (XGBRegressor): XGBRegressor of the xgboost.sklearn method
         trained with evapotranspiration information
     """
+    start = time.perf_counter()
+
     # Splitting the dataset into training and testing sets
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, **SPLIT)
+
+    if params.get('tree_method') == 'hist':
+        xg_reg = xgboost_train_large(X_train, X_test, y_train, y_test, params)
 
-    # Creating the XGBoost regression model
-    xg_reg = xgb.XGBRegressor(objective ='reg:squarederror', seed=42)
+    else:
+        # Creating the XGBoost regression model
+        xg_reg = xgb.XGBRegressor(**params)
 
-    # Training the model
-    xg_reg.fit(X_train, y_train)
+        # Training the model
+        xg_reg.fit(X_train, y_train)
 
     # Making predictions on the test set
     y_pred = xg_reg.predict(X_test)
 
-    # Calculating and printing the Mean Squared Error
+    # Calculating and logging the Root Mean Squared Error
     rmse = np.sqrt(mean_squared_error(y_test, y_pred))
+    seconds = time.perf_counter() - start
+
+    message = (f"Trained on {len(X_train)} rows in {seconds:.1f} s, "
+               f"holdout RMSE {rmse:.4f}")
+    if params.get('tree_method') == 'hist':
+        booster = xg_reg.get_booster()
+        message += f", {booster.num_boosted_rounds()} rounds"
+        if 'best_iteration' in booster.attributes():
+            message += f", best round {booster.best_iteration + 1}"
+    print(message)
+    if logger is not None:
+        logger.info(f"{message} \n")
+
+    return xg_reg
+
+
+def xgboost_train_large(X_train, X_test, y_train, y_test, params=LARGE_PARAMS):
+    """
+    Training XGBoost algorithm on large datasets. The features are quantized
+    once in a QuantileDMatrix and the trees are built with the histogram
+    method on all cores, stopping early when the holdout RMSE stops improving.
+
+    Args:
+        X_train (pandas.Dataframe): features of the training set
+        X_test (pandas.Dataframe): features of the holdout set
+        y_train (pandas.series): target of the training set
+        y_test (pandas.series): target of the holdout set
+        params (dict): parameters of the model
+
+    Returns:
+        xg_reg (XGBRegressor): XGBRegressor with the trained booster, predicting
+        with the trees up to the best round
+    """
+    threads = os.cpu_count()
+    booster_params = {key: value for key, value in params.items()
+                      if key not in ('rounds', 'early_stopping')}
+    booster_params['nthread'] = threads
+
+    # Quantize the features once, the holdout set with the bins of the training set
+    dtrain = xgb.QuantileDMatrix(X_train, y_train, max_bin=params['max_bin'],
+                                 nthread=threads)
+    dtest = xgb.QuantileDMatrix(X_test, y_test, ref=dtrain, nthread=threads)
+
+    booster = xgb.train(booster_params, dtrain, num_boost_round=params['rounds'],
+                        evals=[(dtest, 'holdout')],
+                        early_stopping_rounds=params['early_stopping'] or None,
+                        verbose_eval=False)
+
+    # Same interface as the default training mode
+    xg_reg = xgb.XGBRegressor()
+    xg_reg.load_model(bytearray(booster.save_raw(raw_format='json')))
 
     return xg_reg
 
@@ -111,38 +671,260 @@ def xgboost_test(xg_reg, X_new):
     return predictions
 
 
-def main():
+def blocked_folds(data, folds=FOLDS, field_groups=FIELD_GROUPS):
     """
-    Main function of this script
+    Create cross-validation folds blocked by field and time. The dates are
+    split in folds + 1 consecutive blocks and the fields in field_groups
+    groups. Each fold validates on one time block of one field group and
+    trains on the earlier blocks of the other field groups, so no future day
+    and no day of a validation field is trained on.
+
+    Args:
+        data (pandas.Dataframe): dataframe with 'date' and 'field' columns
+        folds (int): number of time blocks to validate on
+        field_groups (int): number of field groups
+
+    Returns:
+        (list): list with (train index, validation index) arrays per fold,
+        empty when there are not more dates than folds
     """
-    args = parse_args()
+    dates = np.unique(data['date'])
+    if len(dates) <= folds:
+        return []
 
-    ## Add info from data to log file
-    data = pd.read_csv(args.train)
-    new_data = pd.read_csv(args.predict)
+    blocks = np.searchsorted([block[0] for block in np.array_split(dates, folds + 1)],
+                             data['date'], side='right') - 1
 
-    # Split the data into features and target variable
-    X = data[['date','field','Tmin','Tmax','Tmean','RHmin','RHmax','uz','n',
-              'day_of_year', 'ET0']]
-    y = data['ETc']
+    fields = np.unique(data['field'])
+    groups = np.searchsorted(fields, data['field']) % field_groups
 
-    # Train XGBoost algorithm on data
-    xg_reg = xgboost_train(X,y)
+    fold_list = []
+    for block, group in itertools.product(range(1, folds + 1), range(field_groups)):
+        train_index = np.flatnonzero((blocks < block) & (groups != group))
+        test_index = np.flatnonzero((blocks == block) & (groups == group))
+        if len(train_index) and len(test_index):
+            fold_list.append((train_index, test_index))
 
-    # Make ETc predictions on new data
-    X_new = new_data[['date', 'field','Tmin','Tmax','Tmean','RHmin','RHmax',
-                      'uz','n','day_of_year', 'ET0']]
-    predictions = xgboost_test(xg_reg, X_new)
+    return fold_list
 
-    # Add predicted ETc to dataframe
-    new_data['ETc'] = predictions
 
-    new_data['date'].dtype
-    new_data['datex'] = pd.to_datetime(new_data['date']+86400,
-                                       origin='1970-01-01', unit='s', utc=False)
+def candidates(search='grid', number=10, seed=42):
+    """
+    Create the parameter candidates of a search
+
+    Args:
+        search (str): 'grid' for every combination of GRID, 'random' for a
+        random sample of it
+        number (int): number of candidates of a random search
+        seed (int): seed of the random search
+
+    Returns:
+        (list): list with a dictionary of parameters per candidate
+    """
+    grid = [dict(zip(GRID, values)) for values in itertools.product(*GRID.values())]
+    if search == 'grid':
+        return grid
+
+    rng = np.random.default_rng(seed)
+    chosen = rng.choice(len(grid), size=min(number, len(grid)), replace=False)
+
+    return [grid[i] for i in chosen]
+
+
+def init_tuning_worker(data):
+    """
+    Initialize a worker process with the training data, so it is sent to
+    each process once instead of with every fold
+
+    Args:
+        data (pandas.Dataframe): dataframe with features and target
+    """
+    global tuning_data
+    tuning_data = data
+
+
+def fold_rmse(params, train_index, test_index):
+    """
+    Train a candidate on one fold and calculate the RMSE of its validation set
+
+    Args:
+        params (dict): parameters of the candidate
+        train_index (np.array): rows to train on
+        test_index (np.array): rows to validate on
+
+    Returns:
+        (float): RMSE of the validation set
+    """
+    X = tuning_data[FEATURES]
+    y = tuning_data[TARGET]
+
+    # One thread per fold, the folds run in parallel
+    xg_reg = xgb.XGBRegressor(**PARAMS, **params, n_jobs=1)
+    xg_reg.fit(X.iloc[train_index], y.iloc[train_index])
+    y_pred = xg_reg.predict(X.iloc[test_index])
+
+    return float(np.sqrt(mean_squared_error(y.iloc[test_index], y_pred)))
+
+
+def candidate_path(directory, params):
+    """
+    Path of the cached result of a candidate
+
+    Args:
+        directory (str): directory of the results of a search
+        params (dict): parameters of the candidate
+
+    Returns:
+        (str): path of the result file
+    """
+    key = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+    return os.path.join(directory, f"{key}.json")
+
+
+def tune(file, directory, search='grid', number=10, seed=42, folds=FOLDS,
+         field_groups=FIELD_GROUPS, workers=1, logger=None):
+    """
+    Search the hyperparameters with the lowest mean RMSE over field and time
+    blocked folds, and save a model trained on all data with them. The
+    result of every candidate is saved as soon as all its folds are done, so
+    an interrupted search continues with the remaining candidates.
+
+    Args:
+        file (str): path of the training data
+        directory (str): directory of the saved models
+        search (str): 'grid' or 'random'
+        number (int): number of candidates of a random search
+        seed (int): seed of the random search
+        folds (int): number of time blocks to validate on
+        field_groups (int): number of field groups
+        workers (int): number of processes training folds in parallel
+        logger (logging.Logger): logger of the results or None
+
+    Returns:
+        path (str): path of the saved model
+    """
+    data = table_io.read_table(file, columns=FEATURES + [TARGET])
+    data = data[FEATURES + [TARGET]].reset_index(drop=True)
+
+    fold_list = blocked_folds(data, folds, field_groups)
+    if not fold_list:
+        print("Error: Too few dates or fields for the folds.")
+        sys.exit(1)
+
+    # Results of a search are kept per training data and folds
+    search_key = model_key(data, {'folds': folds, 'field_groups': field_groups})
+    search_dir = os.path.join(directory, 'tuning', search_key)
+    os.makedirs(search_dir, exist_ok=True)
+
+    candidate_list = candidates(search, number, seed)
+    results = {}
+    pending = []
+    for i, params in enumerate(candidate_list):
+        path = candidate_path(search_dir, params)
+        if os.path.exists(path):
+            with open(path) as result_file:
+                results[i] = json.load(result_file)
+        else:
+            pending.append(i)
+
+    print(f"{len(candidate_list)} candidates, {len(results)} done before, "
+          f"{len(fold_list)} folds per candidate")
+
+    if pending:
+        scores = {i: {} for i in pending}
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_tuning_worker,
+                                       initargs=(data,))
+        try:
+            futures = {executor.submit(fold_rmse, candidate_list[i], *fold): (i, j)
+                       for i in pending for j, fold in enumerate(fold_list)}
+
+            for future in as_completed(futures):
+                i, j = futures[future]
+                scores[i][j] = future.result()
+                if len(scores[i]) < len(fold_list):
+                    continue
+
+                # All folds of the candidate are done
+                rmse = [scores[i][j] for j in range(len(fold_list))]
+                results[i] = {'params': candidate_list[i], 'fold_rmse': rmse,
+                              'mean_rmse': float(np.mean(rmse))}
+                path = candidate_path(search_dir, candidate_list[i])
+                with open(path + '.tmp', 'w') as result_file:
+                    json.dump(results[i], result_file, indent=2)
+                os.replace(path + '.tmp', path)
+
+                print(f"Candidate {len(results)}/{len(candidate_list)}: "
+                      f"mean RMSE {results[i]['mean_rmse']:.4f} {candidate_list[i]}")
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    best = min(results.values(), key=lambda result: result['mean_rmse'])
+    message = f"Best mean RMSE {best['mean_rmse']:.4f} with {best['params']}"
+    print(message)
+    if logger is not None:
+        logger.info(f"{message} \n")
+
+    # Train the best candidate on all data
+    params = dict(PARAMS, **best['params'])
+    xg_reg = xgb.XGBRegressor(**params)
+    xg_reg.fit(data[FEATURES], data[TARGET])
+
+    path = model_path(directory, model_key(data, params))
+    schema = {'features': FEATURES,
+              'dtypes': {feature: str(data[feature].dtype) for feature in FEATURES},
+              'target': TARGET,
+              'params': params,
+              'cross_validation': {'folds': folds, 'field_groups': field_groups,
+                                   'fold_rmse': best['fold_rmse'],
+                                   'mean_rmse': best['mean_rmse']},
+              'training_file': os.path.abspath(file),
+              'rows': len(data),
+              'windows': [data_window(data, file, xg_reg)]}
+    save_model(xg_reg, schema, path)
+    print(f"Model saved in: {path}")
+
+    return path
+
+
+def main():
+    """
+    Main function of this script
+    """
+    # Configure logger
+    logger = configure_logger()
+
+    args = parse_args()
 
-    # Save data to csv file
-    new_data.to_csv(args.result, index=False)
+    if args.command == "train":
+        train(args.train, args.models, args.force, training_params(args), logger)
+
+    elif args.command == "update":
+        update(args.model, args.train, args.models, args.trees, args.force, logger)
+
+    elif args.command == "tune":
+        tune(args.train, args.models, args.search, args.candidates, args.seed, args.folds,
+             args.field_groups, args.workers, logger)
+
+    elif args.command == "predict":
+        path = args.model
+        if path is None:
+            data = table_io.read_table(args.train, columns=FEATURES + [TARGET])
+            path = model_path(args.models, model_key(data[FEATURES + [TARGET]],
+                                                     training_params(args)))
+            if not os.path.exists(path):
+                print(f"Error: No saved model of {args.train}, run the train command first.")
+                sys.exit(1)
+
+    else:
+        # Train only when the training data or parameters changed
+        path = train(args.train, args.models, params=training_params(args), logger=logger)
+
+    if args.command not in ("train", "update", "tune"):
+        if args.stream:
+            predict_stream(path, args.predict, args.result, args.chunksize)
+        else:
+            predict(path, args.predict, args.result)
 
     return 0
 
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+pipeline
+Description: run the whole chain from hourly weather data to ETc in one
+process. Weather data is fetched, or read from a file, aggregated per location
+and day, joined with NDVI values and passed to ET0, Kc and ETc calculation in
+memory. Intermediate results are only written to disk when asked for.
+Author: Susan Reefman
+Date: 16/10/2026
+Version: 1.0
+"""
+
+# Import necessary modules
+import os
+import sys
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+# The weather scripts import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'Get_Weather_Data'))
+
+# Import additional scripts
+import main as etc_main
+import radiation_table
+import get_weather_data
+import weather_data_processing
+import response_cache
+import table_io
+from NDVI_Data import Kc_curve
+
+
+# Constants
+LOGGER_NAME = 'pipeline'
+JOIN_COLUMNS = ['field', 'lat', 'lon']
+NDVI_COLUMNS = set(JOIN_COLUMNS) | {'doy', 'NDVI', 'average'}
+
+
+# Functions
+def parse_args():
+    """
+    parse command-line arguments for input and output files and check validity
+
+    Returns:
+        args (argparse.Namespace): parsed arguments
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-m", "--manifest",
+                        help="""CSV file with 'lat' and 'lon' columns, and optionally
+                        a 'field' column, of the locations to fetch weather data for.
+                        With --hourly only used to name the fields""")
+    parser.add_argument("-d", "--date", type=int,
+                        help="""First date to fetch in Unix timestamp format""")
+    parser.add_argument("-e", "--end", type=int,
+                        help="""Last date to fetch in Unix timestamp format""")
+    parser.add_argument("--hourly",
+                        help="""CSV, Parquet or Feather file with hourly weather data
+                        retrieved earlier, instead of fetching""")
+    parser.add_argument("-n", "--ndvi",
+                        help="""CSV, Parquet or Feather file with 'doy' and 'NDVI' (or
+                        'average') columns, and 'field' or 'lat' and 'lon' columns for
+                        more than one field""",
+                        required=True)
+    parser.add_argument("-r", "--result",
+                        help="""The location and name result file in CSV, Parquet
+                        (.parquet) or Feather (.feather) format""",
+                        required=True)
+    parser.add_argument("-i", "--intermediate",
+                        help="""Directory to save the hourly, daily and joined data""")
+    parser.add_argument("--format", choices=['csv', 'parquet', 'feather'], default='csv',
+                        help="""Format of the intermediate files""")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                        help="""Number of processes calculating fields in parallel""")
+    parser.add_argument("-b", "--breakpoints", choices=Kc_curve.ENGINES, default='dp',
+                        help="""Engine to find the breakpoints of the Kc curve""")
+    parser.add_argument("--kc-cache",
+                        help="""Directory to store fitted Kc curves between runs""")
+    parser.add_argument("--kc-cache-size", type=int, default=Kc_curve.CACHE_SIZE,
+                        help="""Maximum number of Kc curves kept in the cache""")
+    parser.add_argument("--radiation-cache",
+                        help="""Directory to store the extraterrestrial radiation
+                        tables between runs""")
+    parser.add_argument("-c", "--concurrency", type=int,
+                        default=get_weather_data.CONCURRENCY,
+                        help="""Maximum number of simultaneous requests""")
+    parser.add_argument("--rate", type=float, default=get_weather_data.RATE,
+                        help="""Maximum number of requests per second""")
+    parser.add_argument("--cache", default=os.getenv('weather_cache'),
+                        help="""SQLite database caching the API responses between runs""")
+    parser.add_argument("--cache-size", type=int, default=response_cache.MAX_ENTRIES,
+                        help="""Maximum number of responses in the cache""")
+    parser.add_argument("--grid", type=float, default=get_weather_data.GRID_RESOLUTION,
+                        help="""Resolution in decimal degrees of the altitude grid""")
+    parser.add_argument("--weather-grid", type=float, default=get_weather_data.WEATHER_GRID,
+                        help="""Resolution in decimal degrees of the weather grid, 0 to
+                        fetch every location""")
+    args = parser.parse_args()
+
+    if args.hourly is None:
+        if args.manifest is None or args.date is None:
+            print('Please provide a manifest and date to fetch, or an hourly weather file.')
+            sys.exit(1)
+
+        for date in (args.date, args.end):
+            if date is not None and not get_weather_data.is_valid_date(date):
+                print('Invalid date input. Please provide a valid Unix timestamp.')
+                sys.exit(1)
+
+    return args
+
+
+def configure_logger():
+    """
+    Create logger to store information with a specified log file
+
+    Returns:
+        logger (logging.Logger): The configured logger instance.
+    """
+    # Create a logger
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(logging.DEBUG)
+
+    # Check if handlers already exist to avoid duplication
+    if not logger.handlers:
+        # Create a file handler
+        file_handler = logging.FileHandler('pipeline_log.log')
+        file_handler.setLevel(logging.DEBUG)
+
+        # Create a formatter and set the formatter for the handler
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        file_handler.setFormatter(formatter)
+
+        # Add the handler to the logger
+        logger.addHandler(file_handler)
+    logger.propagate = False
+
+    return logger
+
+
+def init_worker(radiation_cache):
+    """
+    Initialize a worker process with the pipeline logger and the radiation
+    table of the main process, so the log of every field reaches
+    pipeline_log.log also when worker processes are spawned
+
+    Args:
+        radiation_cache (str): directory of the radiation table cache or None
+    """
+    configure_logger()
+    if radiation_cache:
+        radiation_table.configure(cache_dir=radiation_cache)
+
+
+def save(df, directory, name, logger):
+    """
+    Save an intermediate result when a directory is given
+
+    Args:
+        df (pandas.Dataframe): intermediate result
+        directory (str): directory of intermediate results or None
+        name (str): file name
+    """
+    if directory is None:
+        return
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    table_io.write_table(df, path)
+    logger.info(f"Intermediate result saved in {path} \n")
+
+
+def fetch(args, locations):
+    """
+    Fetch hourly weather data of all days for all locations
+
+    Args:
+        args (argparse.Namespace): parsed arguments
+        locations (list): list with (name, latitude, longitude) per location
+
+    Returns:
+        hourly (pandas.Dataframe): dataframe with hourly weather data in the
+        format of the result file of get_weather_data.py
+    """
+    api_key_w = os.getenv('api_key_w')
+    api_key_a = os.getenv('api_key_a')
+
+    end = args.end if args.end is not None else args.date
+    dates = list(range(args.date, end + 1, get_weather_data.DAY))
+
+    cache = None
+    if args.cache is not None:
+        cache = response_cache.ResponseCache(args.cache, args.cache_size)
+
+    try:
+        rows = get_weather_data.batch(locations, dates, api_key_w, api_key_a,
+                                      args.concurrency, args.rate, cache, args.grid,
+                                      args.weather_grid)
+    finally:
+        if cache is not None:
+            cache.close()
+
+    return pd.DataFrame([row for location_rows in rows.values() for row in location_rows])
+
+
+def aggregate(hourly, logger):
+    """
+    Validate hourly weather data and aggregate it per location and day
+
+    Args:
+        hourly (pandas.Dataframe): dataframe with hourly weather data
+
+    Returns:
+        daily (pandas.Dataframe): dataframe with daily weather data, including
+        'doy' and altitude 'z'
+    """
+    data = weather_data_processing.prepare_data(hourly, logger)
+    partial = weather_data_processing.partial_aggregates(data)
+
+    return weather_data_processing.finish_aggregates(partial)
+
+
+def join_ndvi(daily, ndvi, locations, logger):
+    """
+    Join NDVI values to daily weather data by day in the year, and by field or
+    location when the NDVI data has those columns
+
+    Args:
+        daily (pandas.Dataframe): dataframe with daily weather data
+        ndvi (pandas.Dataframe): dataframe with NDVI values
+        locations (list): list with (name, latitude, longitude) per location,
+        empty when weather data was not fetched
+
+    Returns:
+        df (pandas.Dataframe): dataframe with daily weather data and NDVI of
+        the days with both
+    """
+    # Result of ndvi_processing.py names the NDVI column 'average'
+    if 'NDVI' not in ndvi.columns and 'average' in ndvi.columns:
+        ndvi = ndvi.rename(columns={'average': 'NDVI'})
+
+    keys = [column for column in JOIN_COLUMNS if column in ndvi.columns]
+
+    if 'field' in keys and 'field' not in daily.columns:
+        names = {(float(lat), float(lon)): name for name, lat, lon in locations}
+        daily = daily.assign(field=[names.get(location) for location in
+                                    zip(daily['lat'], daily['lon'])])
+
+    df = daily.merge(ndvi[keys + ['doy', 'NDVI']], on=keys + ['doy'], how='inner')
+    logger.info(f"Joined NDVI on {keys + ['doy']}: {len(df)} of {len(daily)} days \n")
+
+    return df
+
+
+def main():
+    """
+    Main function of the pipeline, fetching or reading weather data,
+    aggregating it per day, joining NDVI and calculating ET0, Kc and ETc
+    """
+
+    # Configure logger
+    logger = configure_logger()
+
+    # Log the start of the pipeline
+    logger.info("Pipeline started.\n")
+
+    # Load env file with API keys and settings
+    get_weather_data.configure()
+
+    args = parse_args()
+
+    # Locations and their field names
+    locations = []
+    if args.manifest is not None:
+        locations = get_weather_data.read_manifest(args.manifest)
+
+    # Hourly weather data
+    if args.hourly is not None:
+        logger.info(f"Using hourly weather file: {args.hourly} \n")
+        hourly = weather_data_processing.read_data(args.hourly, logger)
+    else:
+        logger.info(f"Fetching weather data of {len(locations)} locations \n")
+        hourly = fetch(args, locations)
+        save(hourly, args.intermediate, f'hourly.{args.format}', logger)
+
+    # Daily weather data per location
+    daily = aggregate(hourly, logger)
+    del hourly
+    save(daily, args.intermediate, f'daily.{args.format}', logger)
+
+    # Join NDVI values
+    ndvi = table_io.read_table(args.ndvi, columns=lambda column: column in NDVI_COLUMNS)
+    df = join_ndvi(daily, ndvi, locations, logger)
+    save(df, args.intermediate, f'joined.{args.format}', logger)
+
+    if df.empty:
+        logger.info("No days with both weather data and NDVI values \n")
+        print("No days with both weather data and NDVI values, see pipeline_log.log")
+        sys.exit(1)
+
+    if args.radiation_cache:
+        radiation_table.configure(cache_dir=args.radiation_cache)
+
+    # Cache of fitted Kc curves
+    cache = None
+    if args.kc_cache:
+        cache = Kc_curve.KcCache(args.kc_cache, args.kc_cache_size)
+
+    # Worker processes calculating fields in parallel
+    executor = None
+    if args.workers > 1:
+        executor = ProcessPoolExecutor(max_workers=args.workers,
+                                       initializer=init_worker,
+                                       initargs=(args.radiation_cache,))
+
+    try:
+        # ET0, Kc and ETc calculation per field
+        fields = etc_main.split_fields(df)
+        logger.info(f"Number of fields: {len(fields)} \n")
+        df_ETc = pd.concat(etc_main.process_fields(fields, logger, executor,
+                                                   args.breakpoints, cache),
+                           ignore_index=True)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    # Save to result file
+    table_io.write_table(df_ETc, args.result)
+    logger.info(f"Result saved in {args.result} \n")
+
+    # Log the end of the pipeline
+    logger.info("Pipeline finished.")
+
+    # Close the logger handlers to release resources
+    logging.shutdown()
+
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\nScript terminated by the user.")
+        sys.exit(1)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+radiation_table
+Description: lookup table of the astronomical terms used in the solar radiation
+calculation. Extraterrestrial radiation (Ra) and daylight hours (N) only depend
+on latitude and day in the year, so they are computed once per latitude for
+every day of the year and kept in a bounded in-memory cache, with an optional
+cache of .npy files on disk that is shared between runs.
+Author: Susan Reefman
+Date: 16/10/2026
+Version: 1.0
+"""
+
+# Import necessary modules
+import os
+import math
+import logging
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DAYS = 366
+MAXSIZE = 256
+
+
+# Functions
+def extraterrestrial_radiation(lat, doy):
+    """
+    Calculate extraterrestrial radiation and daylight hours from latitude
+    and day in the year
+
+    Args:
+        lat (float): latitude coordinates of location
+        doy (float): day in the year
+
+    Returns:
+        r_a (float): extraterrestrial radiation (MJ/m^2/day)
+        sunshine_duration (float): daylight hours (hour)
+    """
+    # convert latitude to radians
+    latitude = lat*math.pi/180
+
+    # calculate solar radiation parameters
+    d_r = 1 + 0.033 * math.cos(2 * math.pi * doy / 365)
+    solar_declination = 0.409 * math.sin(2 * math.pi * doy / 365 - 1.39)
+    sunset_hour_angle = math.acos(-math.tan(latitude) * math.tan(solar_declination))
+
+    r_a = (24 * 60 / math.pi * 0.082 * d_r *
+          (sunset_hour_angle * math.sin(latitude) * math.sin(solar_declination) +
+           math.cos(latitude) * math.cos(solar_declination) * math.sin(sunset_hour_angle)))
+
+    sunshine_duration = (24*sunset_hour_angle) / math.pi
+
+    return r_a, sunshine_duration
+
+
+def build_table(lat):
+    """
+    Calculate extraterrestrial radiation and daylight hours of every day
+    in the year for one latitude
+
+    Args:
+        lat (float): latitude coordinates of location
+
+    Returns:
+        table (np.array): array with shape (2, 367), row 0 with Ra and row 1
+        with daylight hours, indexed by day in the year. Days where the sun
+        does not rise or set are NaN.
+    """
+    table = np.full((2, DAYS + 1), np.nan)
+    for doy in range(1, DAYS + 1):
+        try:
+            table[:, doy] = extraterrestrial_radiation(lat, doy)
+        except ValueError:
+            # Polar day or night, sunset hour angle is not defined
+            continue
+
+    return table
+
+
+class RadiationTable:
+    """
+    Bounded cache of radiation tables keyed by latitude, optionally backed by
+    .npy files in a cache directory
+
+    Args:
+        maxsize (int): maximum number of latitudes kept in memory
+        cache_dir (str): directory for .npy files, None to disable the disk cache
+    """
+
+    def __init__(self, maxsize=MAXSIZE, cache_dir=None):
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self._tables = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, lat):
+        """
+        Path of the .npy file of a latitude
+        """
+        return os.path.join(self.cache_dir, f"ra_{float(lat)!r}.npy")
+
+    def _load(self, lat):
+        """
+        Load the table of a latitude from the disk cache, or build and store it
+        """
+        if self.cache_dir is None:
+            return build_table(lat)
+
+        path = self._path(lat)
+        try:
+            return np.load(path)
+        except (FileNotFoundError, ValueError, OSError):
+            pass
+
+        table = build_table(lat)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as file:
+                np.save(file, table)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write radiation table to {path}: {e}")
+
+        return table
+
+    def get(self, lat):
+        """
+        Get the radiation table of a latitude
+
+        Args:
+            lat (float): latitude coordinates of location
+
+        Returns:
+            table (np.array): array with shape (2, 367), see build_table
+        """
+        lat = float(lat)
+        table = self._tables.get(lat)
+        if table is not None:
+            self._tables.move_to_end(lat)
+            self.hits += 1
+            return table
+
+        self.misses += 1
+        table = self._load(lat)
+        self._tables[lat] = table
+        if len(self._tables) > self.maxsize:
+            self._tables.popitem(last=False)
+
+        return table
+
+    def lookup(self, lat, doy):
+        """
+        Extraterrestrial radiation and daylight hours for a single day
+
+        Args:
+            lat (float): latitude coordinates of location
+            doy (float): day in the year
+
+        Returns:
+            r_a (float): extraterrestrial radiation (MJ/m^2/day)
+            sunshine_duration (float): daylight hours (hour)
+        """
+        if not 1 <= doy <= DAYS or doy != int(doy):
+            return extraterrestrial_radiation(lat, doy)
+
+        r_a, sunshine_duration = self.get(lat)[:, int(doy)]
+        if math.isnan(r_a):
+            return extraterrestrial_radiation(lat, doy)
+
+        return float(r_a), float(sunshine_duration)
+
+    def lookup_array(self, lat, doy):
+        """
+        Extraterrestrial radiation and daylight hours for arrays of
+        latitudes and days in the year
+
+        Args:
+            lat (np.array): latitude coordinates of location
+            doy (np.array): day in the year
+
+        Returns:
+            r_a (np.array): extraterrestrial radiation (MJ/m^2/day)
+            sunshine_duration (np.array): daylight hours (hour)
+        """
+        lat, doy = np.broadcast_arrays(np.asarray(lat, dtype=float),
+                                       np.asarray(doy, dtype=float))
+        shape = lat.shape
+        if lat.size == 0:
+            return np.empty(shape), np.empty(shape)
+
+        # Flat arrays, the result gets the shape of the input
+        lat, doy = lat.ravel(), doy.ravel()
+
+        in_table = (doy == np.floor(doy)) & (doy >= 1) & (doy <= DAYS)
+        day = np.where(in_table, doy, 0).astype(int)
+
+        # One table per latitude, gathered for all rows at once
+        unique_lat, inverse = np.unique(lat, return_inverse=True)
+        tables = np.stack([self.get(value) for value in unique_lat])
+        inverse = inverse.reshape(-1)
+        r_a = tables[inverse, 0, day]
+        sunshine_duration = tables[inverse, 1, day]
+
+        # Days outside the table are calculated directly
+        for i in np.flatnonzero(np.isnan(r_a)):
+            try:
+                r_a[i], sunshine_duration[i] = extraterrestrial_radiation(lat[i], doy[i])
+            except ValueError:
+                continue
+
+        return r_a.reshape(shape), sunshine_duration.reshape(shape)
+
+    def clear(self):
+        """
+        Empty the in-memory cache
+        """
+        self._tables.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# Table shared by all callers in this process
+shared_table = RadiationTable(cache_dir=os.getenv('radiation_cache_dir'))
+
+
+def configure(cache_dir=None, maxsize=MAXSIZE):
+    """
+    Replace the shared radiation table, for example to enable the disk cache
+
+    Args:
+        cache_dir (str): directory for .npy files, None to disable the disk cache
+        maxsize (int): maximum number of latitudes kept in memory
+
+    Returns:
+        shared_table (RadiationTable): the new shared table
+    """
+    global shared_table
+    shared_table = RadiationTable(maxsize=maxsize, cache_dir=cache_dir)
+
+    return shared_table
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+table_io
+Description: reading and writing tables in CSV, Parquet or Feather format,
+chosen by the file extension. Parquet (.parquet, .pq) and Feather (.feather,
+.arrow) files are typed and columnar, so no floats are parsed from text and
+only the requested columns are read. Files with other extensions are CSV.
+Author: Susan Reefman
+Date: 16/10/2026
+Version: 1.0
+"""
+
+import os
+import pandas as pd
+
+# Constants
+FORMATS = {'.csv': 'csv', '.parquet': 'parquet', '.pq': 'parquet',
+           '.feather': 'feather', '.arrow': 'feather'}
+
+
+def file_format(file):
+    """
+    Get the format of a file from its extension
+
+    Args:
+        file (str): path of file
+
+    Returns:
+        (str): 'csv', 'parquet' or 'feather', 'csv' for unknown extensions
+    """
+    _, extension = os.path.splitext(file)
+
+    return FORMATS.get(extension.lower(), 'csv')
+
+
+def is_supported(file):
+    """
+    Check if the extension of a file is one of the supported formats
+
+    Args:
+        file (str): path of file
+
+    Returns:
+        (bool): True for CSV, Parquet and Feather files
+    """
+    _, extension = os.path.splitext(file)
+
+    return extension.lower() in FORMATS
+
+
+def select_columns(file, columns):
+    """
+    Resolve the columns to read from a columnar file, checking that the
+    requested columns are in the file before any rows are read
+
+    Args:
+        file (str): path of Parquet or Feather file
+        columns (list or callable): list with column names, or a function
+        returning True for each column to read, None for all columns
+
+    Returns:
+        (list): list with column names or None for all columns
+    """
+    if columns is None:
+        return columns
+
+    import pyarrow.parquet as pq
+    import pyarrow.ipc as ipc
+
+    if file_format(file) == 'parquet':
+        names = pq.read_schema(file).names
+    else:
+        with ipc.open_file(file) as reader:
+            names = reader.schema.names
+
+    if callable(columns):
+        return [name for name in names if columns(name)]
+
+    missing = [column for column in columns if column not in names]
+    if missing:
+        raise ValueError(f"Columns expected but not found in {file}: {missing}")
+
+    return list(columns)
+
+
+def read_table(file, columns=None):
+    """
+    Read a file to a pandas dataframe
+
+    Args:
+        file (str): path of file
+        columns (list or callable): list with column names, or a function
+        returning True for each column to read, None for all columns
+
+    Returns:
+        df (pandas.Dataframe): dataframe with the columns of the file
+    """
+    fmt = file_format(file)
+
+    if fmt == 'csv':
+        return pd.read_csv(file, usecols=columns)
+    if fmt == 'parquet':
+        return pd.read_parquet(file, columns=select_columns(file, columns))
+
+    return pd.read_feather(file, columns=select_columns(file, columns))
+
+
+def read_chunks(file, chunksize, columns=None, dtype=None):
+    """
+    Read a file in chunks of rows. The file is opened and the columns are
+    checked right away, so these errors are raised here and not while iterating.
+
+    Args:
+        file (str): path of file
+        chunksize (int): number of rows per chunk
+        columns (list or callable): list with column names, or a function
+        returning True for each column to read, None for all columns
+        dtype (dict): type per column name, None for the types of the file
+
+    Returns:
+        (generator): generator of dataframes with the next rows of the file
+    """
+    fmt = file_format(file)
+
+    if fmt == 'csv':
+        reader = pd.read_csv(file, chunksize=chunksize, usecols=columns, dtype=dtype)
+
+        def chunks():
+            with reader:
+                yield from reader
+
+    elif fmt == 'parquet':
+        import pyarrow.parquet as pq
+
+        batches = pq.ParquetFile(file).iter_batches(
+            batch_size=chunksize, columns=select_columns(file, columns))
+
+        def chunks():
+            for batch in batches:
+                df = batch.to_pandas()
+                yield df if dtype is None else df.astype(dtype)
+
+    else:
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+
+        # Record batches are read, and decompressed, one at a time
+        names = select_columns(file, columns)
+        reader = ipc.open_file(pa.memory_map(file))
+        schema = reader.schema if names is None else pa.schema(
+            [reader.schema.field(name) for name in names])
+
+        def batches():
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                yield batch if names is None else batch.select(names)
+
+        def chunks():
+            pending = []
+            rows = 0
+            for batch in batches():
+                pending.append(batch)
+                rows += batch.num_rows
+
+                # Cut the batches read so far in chunks of chunksize rows
+                while rows >= chunksize:
+                    table = pa.Table.from_batches(pending, schema)
+                    df = table.slice(0, chunksize).to_pandas()
+                    yield df if dtype is None else df.astype(dtype)
+                    pending = table.slice(chunksize).to_batches()
+                    rows -= chunksize
+
+            if rows:
+                df = pa.Table.from_batches(pending, schema).to_pandas()
+                yield df if dtype is None else df.astype(dtype)
+
+    return chunks()
+
+
+def write_table(df, file):
+    """
+    Write a pandas dataframe to a file, without the index
+
+    Args:
+        df (pandas.Dataframe): dataframe to write
+        file (str): path of file
+    """
+    fmt = file_format(file)
+
+    if fmt == 'csv':
+        df.to_csv(file, index=False)
+    elif fmt == 'parquet':
+        df.to_parquet(file, index=False)
+    else:
+        df.reset_index(drop=True).to_feather(file)
+
+
+class TableWriter:
+    """
+    Write a table in parts, with the columns of the first part. Usable as
+    context manager, the file is removed when an error stops the writing.
+
+    Parquet and Feather files have one type per column. Parts read from CSV
+    get their types per chunk, so a column of whole numbers in the first part
+    can have fractions in a later one. Numeric columns are therefore written
+    as float64, unless widen is False because the parts have fixed types.
+
+    Args:
+        file (str): path of file
+        widen (bool): write numeric columns as float64
+    """
+
+    def __init__(self, file, widen=True):
+        self.file = file
+        self.format = file_format(file)
+        self.widen = widen
+        self.rows = 0
+        self.writer = None
+        self.schema = None
+
+        # CSV file is created even when no rows are written
+        if self.format == 'csv':
+            self.writer = open(file, 'w', newline='')
+
+    def write(self, df):
+        """
+        Append the rows of a dataframe
+
+        Args:
+            df (pandas.Dataframe): dataframe to write
+        """
+        if self.format == 'csv':
+            df.to_csv(self.writer, header=(self.rows == 0), index=False)
+            self.rows += len(df)
+            return
+
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+        import pyarrow.parquet as pq
+
+        if self.writer is None:
+            if self.widen:
+                numeric = df.select_dtypes(['integer', 'floating']).columns
+                df = df.astype({column: 'float64' for column in numeric})
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            self.schema = table.schema
+            if self.format == 'parquet':
+                self.writer = pq.ParquetWriter(self.file, self.schema)
+            else:
+                self.writer = ipc.new_file(self.file, self.schema)
+        else:
+            table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+
+        self.writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+        # No half written files
+        if exc_type is not None and os.path.exists(self.file):
+            os.remove(self.file)